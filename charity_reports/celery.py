@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_init, worker_process_init
 
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "charity_reports.settings")
@@ -11,3 +12,23 @@ app.config_from_object("django.conf:settings", namespace="CELERY")
 
 # Automatically discover tasks.py in each Django app.
 app.autodiscover_tasks()
+
+# Report tasks use the "render" and "upload" queues when REPORT_TASK_QUEUES
+# is enabled in settings, see CELERY_TASK_ROUTES there.
+
+
+@worker_init.connect
+def warm_up_rendering(**kwargs):
+    # Prefork children inherit the warmed fonts and assets; thread pools share them
+    from reports.tasks import warm_up_worker
+
+    warm_up_worker()
+
+
+@worker_process_init.connect
+def bootstrap_worker_process(**kwargs):
+    # Runs in every prefork child, including those replaced after
+    # max_tasks_per_child, so no task pays for what was not inherited
+    from reports.tasks import warm_up_worker
+
+    warm_up_worker()
@@ -12,7 +12,9 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
+from django.utils.functional import SimpleLazyObject
 from google.oauth2 import service_account
 
 
@@ -145,13 +147,140 @@ CORS_ALLOWED_ORIGINS = [
 CELERY_BROKER_URL = "redis://localhost:6379/0"
 CELERY_RESULT_BACKEND = "redis://localhost:6379/0"
 
+# Rendering is CPU-bound and uploading waits on the network, so each stage can
+# be routed to its own queue and worker pool, scaled independently:
+#   celery -A charity_reports worker -Q render --pool prefork -c <cores>
+#   celery -A charity_reports worker -Q upload --pool threads -c 10
+# Only enable this once workers consume both queues; otherwise every task,
+# including imports and archiving, runs on the default "celery" queue
+REPORT_TASK_QUEUES = os.getenv("REPORT_TASK_QUEUES", "False") == "True"
+CELERY_TASK_ROUTES = (
+    {
+        "reports.tasks.process_donor_report": {"queue": "render"},
+        "reports.tasks.process_donor_report_batch": {"queue": "render"},
+        "reports.tasks.upload_donor_report": {"queue": "upload"},
+    }
+    if REPORT_TASK_QUEUES
+    else {}
+)
 
-DEFAULT_FILE_STORAGE = "storages.backends.gcloud.GoogleCloudStorage"
-GS_BUCKET_NAME = os.getenv("BUCKET_NAME")
+# Shared cache, used for signed report URLs
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/1"),
+    }
+}
 
+# Directory uploads are spooled to until imported; must be shared with the Celery workers
+INGEST_SPOOL_DIR = os.getenv(
+    "INGEST_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "charity_reports_imports")
+)
+# Copy each upload to the bucket after it has been imported
+INGEST_ARCHIVE_UPLOADS = os.getenv("INGEST_ARCHIVE_UPLOADS", "False") == "True"
+# Number of spreadsheet rows upserted per database transaction
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 1000))
+# Bytes sampled from the start of a CSV upload to detect its encoding
+INGEST_ENCODING_SAMPLE_SIZE = 64 * 1024
+# Stream .xlsx rows in read-only mode instead of loading the workbook with pandas
+INGEST_XLSX_STREAMING = os.getenv("INGEST_XLSX_STREAMING", "True") == "True"
+# Import every sheet of an Excel workbook, parsed in parallel by this many processes
+INGEST_EXCEL_ALL_SHEETS = os.getenv("INGEST_EXCEL_ALL_SHEETS", "False") == "True"
+INGEST_EXCEL_WORKERS = int(os.getenv("INGEST_EXCEL_WORKERS", os.cpu_count() or 1))
+# Invalid rows listed individually in an upload's error report
+INGEST_MAX_REPORTED_ERRORS = 1000
+
+# Chart renderer for reports: "matplotlib" (PNG images) or "reportlab" (vector)
+REPORT_CHART_BACKEND = os.getenv("REPORT_CHART_BACKEND", "matplotlib")
+
+# Donors rendered per report batch task
+REPORT_BATCH_SIZE = int(os.getenv("REPORT_BATCH_SIZE", 50))
+# Donation table rows fetched per round trip while streaming a report
+REPORT_ROW_CHUNK_SIZE = 2000
+# Large donors get a compact table past this many donations...
+REPORT_COMPACT_TABLE_ROWS = int(os.getenv("REPORT_COMPACT_TABLE_ROWS", 40))
+# ...which lists at most this many, summarising the rest in one line
+REPORT_TABLE_MAX_ROWS = int(os.getenv("REPORT_TABLE_MAX_ROWS", 500))
+# Bar chart dates are bucketed by week, month or year past this many bars
+REPORT_MAX_CHART_BARS = int(os.getenv("REPORT_MAX_CHART_BARS", 60))
+
+# Rendered PDFs are kept in memory up to this size, then spilled to a temp file
+REPORT_SPOOL_MAX_SIZE = int(os.getenv("REPORT_SPOOL_MAX_SIZE", 1024 * 1024))
+
+# PDF output settings per profile; text only uses the base-14 PDF fonts,
+# which are never embedded
+REPORT_OUTPUT_PROFILES = {
+    "standard": {
+        "page_compression": True,
+        "chart_format": "png",
+        "chart_dpi": 100,
+    },
+    "compact": {
+        "page_compression": True,
+        "chart_format": "png",
+        "chart_dpi": 72,
+    },
+}
+# "standard" matches the original output, including ReportLab's default page
+# compression; "compact" only lowers the chart resolution, which makes
+# reports with raster charts about a third smaller
+REPORT_OUTPUT_PROFILE = os.getenv("REPORT_OUTPUT_PROFILE", "standard")
+
+# Rendered reports wait here for the upload stage; render and upload workers
+# must share this directory, e.g. by running on the same host
+REPORT_ARTIFACT_DIR = os.getenv(
+    "REPORT_ARTIFACT_DIR",
+    os.path.join(tempfile.gettempdir(), "charity_reports_artifacts"),
+)
+# Upload attempts retried before a rendered report is recorded as failed; the
+# wait between attempts doubles from REPORT_UPLOAD_RETRY_DELAY seconds
+REPORT_UPLOAD_MAX_RETRIES = int(os.getenv("REPORT_UPLOAD_MAX_RETRIES", 3))
+REPORT_UPLOAD_RETRY_DELAY = int(os.getenv("REPORT_UPLOAD_RETRY_DELAY", 10))
+
+# Logo drawn on the report cover, loaded once per worker
+REPORT_LOGO_PATH = os.getenv("REPORT_LOGO_PATH")
+
+# Rendered charts cached per worker, optionally shared through "disk" or "redis"
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", 256))
+CHART_CACHE_BACKEND = os.getenv("CHART_CACHE_BACKEND", "")
+CHART_CACHE_DIR = os.getenv(
+    "CHART_CACHE_DIR", os.path.join(tempfile.gettempdir(), "charity_reports_charts")
+)
+CHART_CACHE_REDIS_URL = os.getenv("CHART_CACHE_REDIS_URL", CELERY_BROKER_URL)
+CHART_CACHE_MAX_BYTES = int(os.getenv("CHART_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+
+# Where reports and archived uploads are stored: "gcs", "local" or "memory"
+REPORT_STORAGE_BACKEND = os.getenv("REPORT_STORAGE_BACKEND", "gcs")
+# Root directory of the "local" backend
+REPORT_STORAGE_DIR = os.getenv("REPORT_STORAGE_DIR", BASE_DIR / "report_files")
+# Prepended to local and in-memory file URLs, e.g. "http://localhost:8000"
+REPORT_STORAGE_BASE_URL = os.getenv("REPORT_STORAGE_BASE_URL", "")
+# Lifetime of signed report URLs in seconds (7 days)
+REPORT_URL_EXPIRY = int(os.getenv("REPORT_URL_EXPIRY", 604800))
+# Cached signed URLs are replaced this many seconds before they expire
+REPORT_URL_REFRESH_MARGIN = int(os.getenv("REPORT_URL_REFRESH_MARGIN", 3600))
+# Signed URLs kept in each process, in front of the shared cache
+SIGNED_URL_CACHE_SIZE = 10000
+# Redirect report downloads to a short-lived signed URL instead of streaming
+# them through Django
+REPORT_DOWNLOAD_REDIRECT = os.getenv("REPORT_DOWNLOAD_REDIRECT", "False") == "True"
+REPORT_REDIRECT_URL_EXPIRY = int(os.getenv("REPORT_REDIRECT_URL_EXPIRY", 300))
 
-GS_CREDENTIALS = service_account.Credentials.from_service_account_file(
-    os.getenv("GS_CREDENTIALS")
+DEFAULT_FILE_STORAGE = "storages.backends.gcloud.GoogleCloudStorage"
+GS_BUCKET_NAME = os.getenv("BUCKET_NAME")
+# Connections kept open by each worker process's storage client; match the
+# upload queue's thread concurrency (-c 10 in the example above)
+GCS_CONNECTION_POOL_SIZE = int(os.getenv("GCS_CONNECTION_POOL_SIZE", 10))
+# Reports are uploaded in resumable chunks of this size (a multiple of 256KB)
+GS_UPLOAD_CHUNK_SIZE = int(os.getenv("GS_UPLOAD_CHUNK_SIZE", 1024 * 1024))
+
+
+# Loaded on first use, so the app starts without credentials on disk
+GS_CREDENTIALS = SimpleLazyObject(
+    lambda: service_account.Credentials.from_service_account_file(
+        os.getenv("GS_CREDENTIALS")
+    )
 )
 MEDIA_URL = f"https://storage.googleapis.com/{GS_BUCKET_NAME}/"
 
@@ -26,7 +26,7 @@ const Dashboard = () => {
   const [errorSnackbarOpen, setErrorSnackbarOpen] = useState(false);
   const [successMessage, setSuccessMessage] = useState("");
   const [errorMessage, setErrorMessage] = useState("");
-  const [taskId, setTaskId] = useState(null);
+  const [jobId, setJobId] = useState(null);
   const [refreshReportsTable, setRefreshReportsTable] = useState(false); // State to trigger refresh
   const [searchQuery, setSearchQuery] = useState(""); // State for search query
 
@@ -93,10 +93,8 @@ const Dashboard = () => {
         }
       );
 
-      setTaskId(response.data.task_ids);
-      setSuccessMessage(
-        "File uploaded successfully! Report generation in progress."
-      );
+      setJobId(response.data.job_id);
+      setSuccessMessage("File uploaded successfully! Import in progress.");
       setSnackbarOpen(true);
     } catch (error) {
       console.error(
@@ -187,7 +185,7 @@ const Dashboard = () => {
           </Tooltip>
         </Box>
 
-        {taskId && <ReportProgressBar taskIds={taskId} />}
+        {jobId && <ReportProgressBar jobId={jobId} />}
 
         {/* Success Snackbar */}
         <Snackbar
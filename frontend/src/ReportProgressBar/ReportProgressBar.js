@@ -6,50 +6,60 @@ import Snackbar from "@mui/material/Snackbar";
 import Alert from "@mui/material/Alert";
 import Typography from "@mui/material/Typography";
 
-const ReportProgressBar = ({ taskIds }) => {
+const ReportProgressBar = ({ jobId }) => {
   const [progress, setProgress] = useState(0);
   const [status, setStatus] = useState("PENDING");
+  const [rowsFailed, setRowsFailed] = useState(0);
   const [snackbarOpen, setSnackbarOpen] = useState(false);
+  const [reportsFailed, setReportsFailed] = useState(0);
   const intervalRef = useRef(null);
 
   useEffect(() => {
-    intervalRef.current = setInterval(() => {
-      fetchTaskStatus();
-    }, 2000);
+    intervalRef.current = setInterval(fetchJobStatus, 2000);
 
     return () => clearInterval(intervalRef.current);
-  }, [taskIds]);
+  }, [jobId]);
 
-  const fetchTaskStatus = async () => {
+  // The import itself fills the first half of the bar, reports the second
+  const fetchJobStatus = async () => {
     try {
-      const taskStatuses = await Promise.all(
-        taskIds.map((taskId) =>
-          axios.get(`http://localhost:8000/api/reports/status/${taskId}/`)
-        )
+      const response = await axios.get(
+        `http://localhost:8000/api/reports/imports/${jobId}/`
       );
+      const {
+        status,
+        progress,
+        rows_failed,
+        reports_total,
+        reports_succeeded,
+        reports_skipped,
+        reports_failed,
+      } = response.data;
+      setRowsFailed(rows_failed);
+      setReportsFailed(reports_failed);
 
-      let totalProgress = 0;
-      let completedTasks = 0;
-
-      taskStatuses.forEach((response) => {
-        const { status, progress } = response.data;
-        totalProgress += progress;
-
-        if (status === "SUCCESS" || status === "FAILED") {
-          completedTasks += 1;
-        }
-      });
-
-      const overallProgress = Math.round(totalProgress / taskIds.length);
-      setProgress(overallProgress);
+      if (status === "FAILED") {
+        setProgress(Math.round(progress / 2));
+        clearInterval(intervalRef.current);
+        setStatus("FAILED");
+        return;
+      }
+      if (status !== "SUCCESS") {
+        setProgress(Math.round(progress / 2));
+        return;
+      }
 
-      if (completedTasks === taskIds.length) {
+      const reportsDone = reports_succeeded + reports_skipped + reports_failed;
+      if (reportsDone >= reports_total) {
+        setProgress(100);
         setSnackbarOpen(true);
         clearInterval(intervalRef.current);
         setStatus("COMPLETED");
+      } else {
+        setProgress(50 + Math.round((reportsDone / reports_total) * 50));
       }
     } catch (error) {
-      console.error("Error fetching task status:", error);
+      console.error("Error fetching import status:", error);
     }
   };
 
@@ -59,6 +69,21 @@ const ReportProgressBar = ({ taskIds }) => {
       <Typography variant="body2" color="textSecondary" align="center" mt={1}>
         {progress}% Complete
       </Typography>
+      {rowsFailed > 0 && (
+        <Typography variant="body2" color="error" align="center" mt={1}>
+          {rowsFailed} rows could not be imported
+        </Typography>
+      )}
+      {reportsFailed > 0 && (
+        <Typography variant="body2" color="error" align="center" mt={1}>
+          {reportsFailed} reports could not be generated
+        </Typography>
+      )}
+      {status === "FAILED" && (
+        <Typography variant="body2" color="error" align="center" mt={1}>
+          Import failed
+        </Typography>
+      )}
       {status === "COMPLETED" && (
         <Snackbar
           open={snackbarOpen}
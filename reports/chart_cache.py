@@ -0,0 +1,231 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+
+# Set up a logger for this module
+logger = logging.getLogger(__name__)
+
+
+def chart_key(kind, data, style):
+    """Hash a chart's kind, aggregated data and style into a cache key."""
+    payload = json.dumps([kind, data, style], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class DiskChartStore:
+    """
+    Charts stored as files in a shared directory, pruned oldest first. The
+    directory is only scanned at startup and when pruning; in between, this
+    process adds the size of its own writes to the total found by the last
+    scan and prunes once that passes max_bytes.
+    """
+
+    # Keys already hash the chart format, so files use a format-neutral suffix
+    suffix = ".chart"
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.total = sum(size for _, size, _ in self._scan())
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}{self.suffix}")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as chart_file:
+                data = chart_file.read()
+        except FileNotFoundError:
+            return None
+        # Touch the file so pruning treats it as recently used
+        os.utime(self._path(key))
+        return data
+
+    def set(self, key, data):
+        path = self._path(key)
+        try:
+            replaced = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced = 0
+        # Write under a temporary name so readers never see a partial file
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        with open(temp_path, "wb") as chart_file:
+            chart_file.write(data)
+        os.replace(temp_path, path)
+
+        with self.lock:
+            self.total += len(data) - replaced
+            if self.total > self.max_bytes:
+                self._prune()
+
+    def _scan(self):
+        # (mtime, size, path) of every chart file in the directory
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.name.endswith(self.suffix):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _prune(self):
+        entries = self._scan()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.total = total
+
+
+class RedisChartStore:
+    """
+    Charts stored in Redis. A sorted set tracks last access per key so the
+    least recently used charts are evicted once the total size passes
+    max_bytes.
+    """
+
+    def __init__(self, url, max_bytes, prefix="chart-cache"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self.index_key = f"{prefix}:index"
+        self.size_key = f"{prefix}:bytes"
+
+    def get(self, key):
+        data = self.client.get(f"{self.prefix}:{key}")
+        if data is not None:
+            self.client.zadd(self.index_key, {key: time.time()})
+        return data
+
+    def set(self, key, data):
+        # Keys hash the chart's inputs, so a stored chart is never replaced
+        # and the byte count only grows by charts that were not stored yet
+        pipe = self.client.pipeline()
+        pipe.set(f"{self.prefix}:{key}", data, nx=True)
+        pipe.zadd(self.index_key, {key: time.time()})
+        created = pipe.execute()[0]
+        if not created:
+            return
+        total = self.client.incrby(self.size_key, len(data))
+
+        while total > self.max_bytes:
+            oldest = self.client.zpopmin(self.index_key)
+            if not oldest:
+                break
+            old_key = f"{self.prefix}:{oldest[0][0].decode()}"
+            size = self.client.strlen(old_key)
+            self.client.delete(old_key)
+            total = self.client.decrby(self.size_key, size)
+
+
+class ChartCache:
+    """
+    Rendered chart images keyed by a hash of their inputs, with an
+    in-process LRU tier in front of an optional shared store.
+    """
+
+    def __init__(self, max_entries, shared_store=None):
+        self.max_entries = max_entries
+        self.shared_store = shared_store
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "shared_hits": 0, "misses": 0}
+
+    def get_or_render(self, key, render):
+        """Return the cached chart bytes for key, calling render() on a miss."""
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None:
+                self.entries.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return data
+
+        data = self._get_shared(key)
+        if data is not None:
+            counter = "shared_hits"
+        else:
+            counter = "misses"
+            data = render()
+            self._set_shared(key, data)
+
+        with self.lock:
+            self.counters[counter] += 1
+            self.entries[key] = data
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return data
+
+    def _get_shared(self, key):
+        if not self.shared_store:
+            return None
+        try:
+            return self.shared_store.get(key)
+        except Exception as e:
+            logger.warning(f"Chart cache read failed: {e}")
+            return None
+
+    def _set_shared(self, key, data):
+        if not self.shared_store:
+            return
+        try:
+            self.shared_store.set(key, data)
+        except Exception as e:
+            logger.warning(f"Chart cache write failed: {e}")
+
+    def stats(self):
+        lookups = sum(self.counters.values())
+        hits = self.counters["memory_hits"] + self.counters["shared_hits"]
+        return {
+            **self.counters,
+            "entries": len(self.entries),
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            for name in self.counters:
+                self.counters[name] = 0
+
+
+_chart_cache = None
+_chart_cache_lock = threading.Lock()
+
+
+def get_chart_cache():
+    """Return this process's chart cache, building it from settings."""
+    global _chart_cache
+    with _chart_cache_lock:
+        if _chart_cache is None:
+            _chart_cache = _build_chart_cache()
+    return _chart_cache
+
+
+def _build_chart_cache():
+    backend = settings.CHART_CACHE_BACKEND
+    if backend == "disk":
+        shared_store = DiskChartStore(
+            settings.CHART_CACHE_DIR, settings.CHART_CACHE_MAX_BYTES
+        )
+    elif backend == "redis":
+        shared_store = RedisChartStore(
+            settings.CHART_CACHE_REDIS_URL, settings.CHART_CACHE_MAX_BYTES
+        )
+    else:
+        shared_store = None
+    return ChartCache(settings.CHART_CACHE_SIZE, shared_store)
@@ -0,0 +1,98 @@
+import functools
+import logging
+import os
+import threading
+import requests
+from google.auth.transport.requests import AuthorizedSession, Request
+from google.cloud import storage
+from google.oauth2 import service_account
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+# Set up a logger for this module
+logger = logging.getLogger(__name__)
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+_adapter = None
+_stats_lock = threading.Lock()
+_stats = {"clients_created": 0, "uploads": 0, "upload_seconds": 0.0}
+
+
+@functools.lru_cache(maxsize=None)
+def get_gcs_credentials():
+    # Load credentials explicitly using the environment variable
+    credentials_path = os.getenv("GS_CREDENTIALS")
+    if not credentials_path:
+        raise ValueError(
+            "Google Cloud credentials path not found in environment variables."
+        )
+
+    logger.info(f"Loading Google Cloud credentials from: {credentials_path}")
+
+    # Parsing the key file is slow, so it is done once per process
+    return service_account.Credentials.from_service_account_file(credentials_path)
+
+
+def get_gcs_client():
+    """
+    Return this process's storage client, creating it on first use. Its HTTP
+    session keeps up to GCS_CONNECTION_POOL_SIZE connections open, and the
+    access token is only refreshed once it has expired. A forked child never
+    reuses its parent's client, whose sockets it would share.
+    """
+    global _client, _client_pid, _adapter
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client, _adapter = _build_gcs_client()
+            _client_pid = os.getpid()
+            with _stats_lock:
+                _stats["clients_created"] += 1
+    return _client
+
+
+def _build_gcs_client():
+    credentials = get_gcs_credentials()
+    pool_size = settings.GCS_CONNECTION_POOL_SIZE
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+
+    # Token refreshes share the uploads' connection pool
+    token_session = requests.Session()
+    token_session.mount("https://", adapter)
+    session = AuthorizedSession(credentials, auth_request=Request(token_session))
+    session.mount("https://", adapter)
+
+    client = storage.Client(
+        project=credentials.project_id, credentials=credentials, _http=session
+    )
+    logger.info(f"Created storage client for worker process {os.getpid()}")
+    return client, adapter
+
+
+def get_gcs_bucket():
+    return get_gcs_client().bucket(settings.GS_BUCKET_NAME)
+
+
+def record_upload(seconds):
+    with _stats_lock:
+        _stats["uploads"] += 1
+        _stats["upload_seconds"] += seconds
+
+
+def gcs_client_stats():
+    """Upload count and latency plus connections opened by this process's client."""
+    connections = 0
+    if _adapter is not None:
+        pools = _adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["connections_opened"] = connections
+    stats["mean_upload_seconds"] = (
+        stats["upload_seconds"] / stats["uploads"] if stats["uploads"] else 0.0
+    )
+    return stats
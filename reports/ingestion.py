@@ -0,0 +1,557 @@
+import codecs
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from dataclasses import dataclass, field
+from decimal import Decimal
+from functools import partial
+from billiard import Pool
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.db import transaction
+import chardet
+import openpyxl
+import pandas as pd
+from donations.models import Donor, Donation
+from .models import Cause
+
+# Set up a logger for this module
+logger = logging.getLogger(__name__)
+
+# Columns every uploaded file must provide
+REQUIRED_COLUMNS = [
+    "Donor ID",
+    "Donation ID",
+    "Donor First Name",
+    "Donor Last Name",
+    "Donor Email",
+    "Donation Amount",
+    "Date of Donation",
+    "Time of Donation",
+    "Cause ID",
+    "Cause",
+]
+
+# Columns that must hold a value on every row
+ID_COLUMNS = ["Donor ID", "Donation ID", "Cause ID"]
+# Read ids as text so a blank cell cannot turn a chunk's ids into floats
+ID_DTYPES = {column: str for column in ID_COLUMNS}
+
+DATE_FORMAT = "%Y-%m-%d"
+# Times are exported as "02:30 PM"; Excel time cells come through as "14:30:00"
+TIME_FORMATS = ["%I:%M %p", "%H:%M:%S"]
+
+DONOR_UPDATE_FIELDS = ["first_name", "last_name", "email", "phone", "address"]
+CAUSE_UPDATE_FIELDS = ["name", "description", "images"]
+# Fields filled from optional columns; files without the column keep the
+# stored value instead of clearing it
+OPTIONAL_COLUMNS = {
+    "phone": "Phone Number",
+    "address": "Address",
+    "description": "Description",
+    "images": "Images",
+}
+DONATION_UPDATE_FIELDS = [
+    "donor",
+    "amount",
+    "date",
+    "time",
+    "payment_type",
+    "recurrence",
+    "cause",
+    "tax_receipt_status",
+]
+
+# Byte order marks, longest first so UTF-32 is not mistaken for UTF-16
+BOM_ENCODINGS = [
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+
+class IngestionError(ValueError):
+    """Raised when an uploaded file cannot be imported."""
+
+
+@dataclass
+class IngestionResult:
+    # Donors whose donations were inserted or changed by this import
+    donor_ids: list = field(default_factory=list)
+    rows_imported: int = 0
+    rows_inserted: int = 0
+    rows_updated: int = 0
+    rows_unchanged: int = 0
+    rows_failed: int = 0
+    errors: list = field(default_factory=list)
+
+    def add_errors(self, errors):
+        self.rows_failed += len(errors)
+        room = settings.INGEST_MAX_REPORTED_ERRORS - len(self.errors)
+        self.errors.extend(errors[: max(room, 0)])
+
+
+def missing_columns(columns):
+    return [column for column in REQUIRED_COLUMNS if column not in columns]
+
+
+def file_digest(fileobj):
+    """Return the SHA-256 hex digest of an uploaded file's content."""
+    digest = hashlib.sha256()
+    for chunk in fileobj.chunks():
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+def spool_upload(uploaded_file, spool_dir=None):
+    """
+    Move an uploaded file into the import spool directory under a unique
+    name and return its path. Uploads Django already wrote to disk are
+    renamed in place; small in-memory uploads are written out.
+    """
+    spool_dir = spool_dir or settings.INGEST_SPOOL_DIR
+    os.makedirs(spool_dir, exist_ok=True)
+    path = os.path.join(
+        spool_dir, f"{uuid.uuid4().hex}_{os.path.basename(uploaded_file.name)}"
+    )
+
+    if hasattr(uploaded_file, "temporary_file_path"):
+        file_move_safe(uploaded_file.temporary_file_path(), path)
+    else:
+        with open(path, "wb") as destination:
+            for chunk in uploaded_file.chunks():
+                destination.write(chunk)
+    return path
+
+
+def detect_encoding(fileobj, sample_size=None):
+    """
+    Guess the text encoding of a file from a bounded sample of its first
+    bytes. The file position is restored afterwards.
+    """
+    sample_size = sample_size or settings.INGEST_ENCODING_SAMPLE_SIZE
+    position = fileobj.tell()
+    sample = fileobj.read(sample_size)
+    fileobj.seek(position)
+
+    for bom, encoding in BOM_ENCODINGS:
+        if sample.startswith(bom):
+            return encoding
+
+    # Most exports are UTF-8; accept a sample cut in the middle of a character
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+
+    return chardet.detect(sample)["encoding"] or "utf-8"
+
+
+def read_csv_chunks(fileobj, chunk_size=None):
+    """Yield DataFrames of at most chunk_size rows from a CSV file object."""
+    chunk_size = chunk_size or settings.INGEST_BATCH_SIZE
+    encoding = detect_encoding(fileobj)
+    logger.info(f"Reading CSV as {encoding} in chunks of {chunk_size} rows")
+    with pd.read_csv(
+        fileobj, encoding=encoding, chunksize=chunk_size, dtype=ID_DTYPES
+    ) as reader:
+        yield from reader
+
+
+def _excel_value(value):
+    # Match pandas: blank cells are missing and whole-number floats are ints
+    if value == "":
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def read_xlsx_chunks(fileobj, chunk_size=None):
+    """
+    Yield DataFrames of at most chunk_size rows from the first sheet of an
+    .xlsx workbook, streaming rows through openpyxl's read-only mode instead
+    of loading the whole workbook. Blank rows are skipped and the frame index
+    keeps each row's position in the sheet for error reporting.
+    """
+    chunk_size = chunk_size or settings.INGEST_BATCH_SIZE
+    workbook = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [
+            name if name is not None else f"Unnamed: {position}"
+            for position, name in enumerate(header)
+        ]
+        logger.info(f"Streaming xlsx rows in chunks of {chunk_size}")
+
+        chunk, index = [], []
+        for row_number, values in enumerate(rows):
+            values = [_excel_value(value) for value in values[: len(columns)]]
+            if all(value is None for value in values):
+                continue
+            chunk.append(values + [None] * (len(columns) - len(values)))
+            index.append(row_number)
+            if len(chunk) == chunk_size:
+                yield pd.DataFrame(chunk, columns=columns, index=index)
+                chunk, index = [], []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=columns, index=index)
+    finally:
+        workbook.close()
+
+
+def _read_excel_sheet(path, sheet_name):
+    df = pd.read_excel(path, sheet_name=sheet_name, dtype=ID_DTYPES)
+    df.attrs["sheet"] = sheet_name
+    return df
+
+
+def read_excel_sheets(fileobj, file_extension, workers=None):
+    """
+    Yield one DataFrame per sheet of an Excel workbook, parsing the sheets in
+    parallel across a process pool. Sheets without the required columns,
+    such as summary tabs, are skipped.
+    """
+    workers = workers or settings.INGEST_EXCEL_WORKERS
+
+    # Worker processes open the workbook by path, so files that are not on
+    # local disk already get a temporary copy
+    path = getattr(fileobj, "name", None)
+    local_copy = None
+    if not (isinstance(path, str) and os.path.isfile(path)):
+        local_copy = tempfile.NamedTemporaryFile(suffix=f".{file_extension}")
+        shutil.copyfileobj(fileobj, local_copy)
+        local_copy.flush()
+        path = local_copy.name
+
+    try:
+        with pd.ExcelFile(path) as workbook:
+            sheet_names = workbook.sheet_names
+        logger.info(
+            f"Reading {len(sheet_names)} sheets with up to {workers} processes"
+        )
+
+        read_sheet = partial(_read_excel_sheet, path)
+        if workers == 1 or len(sheet_names) == 1:
+            frames = map(read_sheet, sheet_names)
+            pool = None
+        else:
+            pool = Pool(processes=min(workers, len(sheet_names)))
+            frames = pool.imap(read_sheet, sheet_names)
+
+        try:
+            for df in frames:
+                if missing_columns(df.columns):
+                    logger.warning(
+                        f"Skipping sheet {df.attrs['sheet']!r} without the required columns"
+                    )
+                    continue
+                yield df
+        finally:
+            if pool:
+                pool.terminate()
+                pool.join()
+    finally:
+        if local_copy:
+            local_copy.close()
+
+
+def read_frames(fileobj, file_extension):
+    """Stream CSV and .xlsx files chunk by chunk, other workbooks by sheet."""
+    if file_extension == "csv":
+        return read_csv_chunks(fileobj)
+    if settings.INGEST_EXCEL_ALL_SHEETS:
+        return read_excel_sheets(fileobj, file_extension)
+    if file_extension == "xlsx" and settings.INGEST_XLSX_STREAMING:
+        return read_xlsx_chunks(fileobj)
+    return [pd.read_excel(fileobj, dtype=ID_DTYPES)]
+
+
+def _value(row, column, default=None):
+    # Empty spreadsheet cells come through pandas as NaN, store them as NULL
+    value = row.get(column, default)
+    if value is None:
+        return default
+    try:
+        if pd.isna(value):
+            return default
+    except (TypeError, ValueError):
+        pass
+    return value
+
+
+def _parse_dates(column):
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return column.dt.date
+    parsed = pd.to_datetime(column, format=DATE_FORMAT, errors="coerce")
+    return parsed.dt.date.where(parsed.notna(), None)
+
+
+def _parse_times(column):
+    text = column.astype("string").str.strip()
+    parsed = pd.Series(pd.NaT, index=column.index, dtype="datetime64[ns]")
+    for time_format in TIME_FORMATS:
+        pending = parsed.isna() & text.notna()
+        if not pending.any():
+            break
+        parsed[pending] = pd.to_datetime(
+            text[pending], format=time_format, errors="coerce"
+        )
+    return parsed.dt.time.where(parsed.notna(), None)
+
+
+def validate_frame(df, seen_donation_ids=None):
+    """
+    Validate a donations DataFrame column by column.
+
+    Returns the rows that passed, with dates, times and amounts already
+    parsed, and an error report entry for every row that did not. Rows are
+    numbered as they appear in the spreadsheet, counting the header as row 1,
+    along with the sheet name for multi-sheet workbooks.
+    Donation ids listed in seen_donation_ids (and earlier rows of this frame)
+    are reported as duplicates; the set is updated with the accepted ids.
+    """
+    if seen_donation_ids is None:
+        seen_donation_ids = set()
+
+    ids = {column: df[column].astype("string").str.strip() for column in ID_COLUMNS}
+    dates = _parse_dates(df["Date of Donation"])
+    times = _parse_times(df["Time of Donation"])
+    amounts = pd.to_numeric(df["Donation Amount"], errors="coerce")
+
+    checks = [
+        (ids[column].isna() | (ids[column] == ""), f"Missing {column}")
+        for column in ID_COLUMNS
+    ]
+    checks += [
+        (dates.isna(), "Invalid Date of Donation, expected YYYY-MM-DD"),
+        (times.isna(), "Invalid Time of Donation, expected HH:MM AM/PM"),
+        (amounts.isna(), "Invalid Donation Amount"),
+        (
+            ids["Donation ID"].duplicated()
+            | ids["Donation ID"].isin(seen_donation_ids),
+            "Duplicate Donation ID",
+        ),
+    ]
+    checks = [(mask.fillna(False).astype(bool), message) for mask, message in checks]
+
+    failed = pd.Series(False, index=df.index)
+    for mask, _ in checks:
+        failed |= mask
+
+    errors = []
+    for index in df.index[failed]:
+        # Blank ids are pd.NA, which has no truth value
+        donation_id = ids["Donation ID"].get(index)
+        error = {
+            "row": int(index) + 2,
+            "donation_id": (
+                None if pd.isna(donation_id) or donation_id == "" else donation_id
+            ),
+            "errors": [message for mask, message in checks if mask[index]],
+        }
+        if "sheet" in df.attrs:
+            error["sheet"] = df.attrs["sheet"]
+        errors.append(error)
+
+    valid = df.loc[~failed].copy()
+    for column in ID_COLUMNS:
+        valid[column] = ids[column][~failed]
+    valid["Date of Donation"] = dates[~failed]
+    valid["Time of Donation"] = times[~failed]
+    valid["Donation Amount"] = amounts[~failed].round(2)
+    seen_donation_ids.update(valid["Donation ID"])
+
+    return valid, errors
+
+
+def build_batch(rows):
+    """
+    Turn a batch of validated rows into unsaved Donor, Cause and Donation
+    instances.
+
+    Donors and causes are deduplicated in memory, keeping the first
+    occurrence of each id the way get_or_create did.
+    """
+    donors = {}
+    causes = {}
+    donations = {}
+
+    for row in rows:
+        donor_id = str(row["Donor ID"])
+        if donor_id not in donors:
+            donors[donor_id] = Donor(
+                donor_id=donor_id,
+                first_name=row["Donor First Name"],
+                last_name=row["Donor Last Name"],
+                email=row["Donor Email"],
+                phone=_value(row, "Phone Number"),
+                address=_value(row, "Address"),
+            )
+
+        cause_id = str(row["Cause ID"])
+        if cause_id not in causes:
+            causes[cause_id] = Cause(
+                cause_id=cause_id,
+                name=row["Cause"],
+                description=_value(row, "Description", ""),
+                images=_value(row, "Images"),
+            )
+
+        donation_id = str(row["Donation ID"])
+        donations[donation_id] = Donation(
+            donor_id=donor_id,
+            donation_id=donation_id,
+            amount=Decimal(str(row["Donation Amount"])),
+            date=row["Date of Donation"],
+            time=row["Time of Donation"],
+            cause_id=cause_id,
+            # Both columns are NOT NULL, so blank cells are stored as ""
+            payment_type=_value(row, "Payment Type", ""),
+            recurrence=_value(row, "Recurrence Status", ""),
+            tax_receipt_status=_value(row, "Tax Receipt Status", False),
+        )
+
+    return list(donors.values()), list(causes.values()), list(donations.values())
+
+
+def diff_donations(donations):
+    """
+    Split donations into inserts, updates and unchanged rows by comparing
+    them with what is already stored.
+
+    Also returns the ids of every donor whose donation set changed, including
+    the previous owner of a donation that moved to another donor.
+    """
+    fields = [Donation._meta.get_field(name) for name in DONATION_UPDATE_FIELDS]
+    existing = {
+        row["donation_id"]: row
+        for row in Donation.objects.filter(
+            donation_id__in=[donation.donation_id for donation in donations]
+        ).values("donation_id", *(f.attname for f in fields))
+    }
+
+    inserts, updates, unchanged = [], [], []
+    changed_donor_ids = set()
+    for donation in donations:
+        stored = existing.get(donation.donation_id)
+        if stored is None:
+            inserts.append(donation)
+        elif any(
+            f.to_python(getattr(donation, f.attname)) != stored[f.attname]
+            for f in fields
+        ):
+            updates.append(donation)
+            changed_donor_ids.add(stored["donor_id"])
+        else:
+            unchanged.append(donation)
+            continue
+        changed_donor_ids.add(donation.donor_id)
+
+    return inserts, updates, unchanged, changed_donor_ids
+
+
+def update_fields(fields, columns):
+    """Drop the fields whose optional column is not among columns, if given."""
+    if columns is None:
+        return fields
+    return [
+        name
+        for name in fields
+        if name not in OPTIONAL_COLUMNS or OPTIONAL_COLUMNS[name] in columns
+    ]
+
+
+def write_batch(donors, causes, donations, columns=None):
+    """
+    Upsert one batch of records inside a single transaction. Donations that
+    match the stored rows are not written, and donor and cause fields from
+    optional columns are only overwritten when columns includes them.
+
+    Returns the diff from diff_donations.
+    """
+    with transaction.atomic():
+        Donor.objects.bulk_create(
+            donors,
+            update_conflicts=True,
+            unique_fields=["donor_id"],
+            update_fields=update_fields(DONOR_UPDATE_FIELDS, columns),
+        )
+        Cause.objects.bulk_create(
+            causes,
+            update_conflicts=True,
+            unique_fields=["cause_id"],
+            update_fields=update_fields(CAUSE_UPDATE_FIELDS, columns),
+        )
+        inserts, updates, unchanged, changed_donor_ids = diff_donations(donations)
+        Donation.objects.bulk_create(
+            inserts + updates,
+            update_conflicts=True,
+            unique_fields=["donation_id"],
+            update_fields=DONATION_UPDATE_FIELDS,
+        )
+    return inserts, updates, unchanged, changed_donor_ids
+
+
+def ingest_frames(frames, batch_size=None, progress=None):
+    """
+    Validate and import an iterable of donations DataFrames in batches.
+    The result's donor_ids only lists donors whose donations changed.
+
+    Frames are consumed one at a time, so a chunked reader keeps memory flat
+    regardless of the file size. Rows that fail validation are skipped and
+    listed in the result's error report instead of aborting the import.
+    progress, if given, is called with the running result after each batch.
+    """
+    batch_size = batch_size or settings.INGEST_BATCH_SIZE
+    result = IngestionResult()
+    donor_ids = {}
+    seen_donation_ids = set()
+
+    for df in frames:
+        missing = missing_columns(df.columns)
+        if missing:
+            raise IngestionError(
+                f"Missing required columns. Expected: {REQUIRED_COLUMNS}"
+            )
+
+        valid, errors = validate_frame(df, seen_donation_ids)
+        result.add_errors(errors)
+        if errors and progress:
+            progress(result)
+
+        for start in range(0, len(valid), batch_size):
+            batch = valid.iloc[start : start + batch_size]
+            donors, causes, donations = build_batch(batch.to_dict("records"))
+            inserts, updates, unchanged, changed_donor_ids = write_batch(
+                donors, causes, donations, df.columns
+            )
+            for donor_id in sorted(changed_donor_ids):
+                donor_ids.setdefault(donor_id, None)
+            result.rows_imported += len(batch)
+            result.rows_inserted += len(inserts)
+            result.rows_updated += len(updates)
+            result.rows_unchanged += len(unchanged)
+            logger.info(
+                f"Imported batch of {len(donations)} donations: "
+                f"{len(inserts)} new, {len(updates)} changed, "
+                f"{len(unchanged)} unchanged ({result.rows_imported} rows so far)"
+            )
+            if progress:
+                progress(result)
+
+    if result.rows_failed:
+        logger.warning(f"Skipped {result.rows_failed} invalid rows")
+
+    result.donor_ids = list(donor_ids)
+    return result
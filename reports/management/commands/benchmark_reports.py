@@ -0,0 +1,87 @@
+import itertools
+import random
+import statistics
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from donations.models import Donor, Donation
+from reports.chart_cache import get_chart_cache
+from reports.models import Cause
+from reports.report_data import ReportData
+from reports.utils import generate_donor_report
+
+
+class Command(BaseCommand):
+    help = "Compare report render time and PDF size across chart backends and output profiles."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reports", type=int, default=20)
+        parser.add_argument("--donations", type=int, default=12)
+        parser.add_argument("--causes", type=int, default=4)
+        parser.add_argument(
+            "--backend",
+            choices=["matplotlib", "reportlab"],
+            action="append",
+            help="Backend to benchmark, may be repeated. Defaults to both.",
+        )
+        parser.add_argument(
+            "--profile",
+            action="append",
+            help="Output profile to benchmark, may be repeated. Defaults to all.",
+        )
+        parser.add_argument(
+            "--cached",
+            action="store_true",
+            help="Keep the chart cache warm between reports instead of clearing it.",
+        )
+
+    def build_donor(self, donations, causes):
+        # Unsaved instances, so the benchmark never touches the database
+        donor = Donor(donor_id="BENCH", first_name="Bench", last_name="Mark")
+        cause_objects = [
+            Cause(cause_id=f"C{index}", name=f"Cause {index}") for index in range(causes)
+        ]
+        start = date(2024, 1, 1)
+        return donor, [
+            Donation(
+                donor=donor,
+                donation_id=f"D{index}",
+                amount=Decimal(random.randint(500, 50000)) / 100,
+                date=start + timedelta(days=index * 7),
+                cause=random.choice(cause_objects),
+            )
+            for index in range(donations)
+        ]
+
+    def handle(self, *args, **options):
+        donor, donations = self.build_donor(options["donations"], options["causes"])
+        chart_cache = get_chart_cache()
+
+        backends = options["backend"] or ["matplotlib", "reportlab"]
+        profiles = options["profile"] or list(settings.REPORT_OUTPUT_PROFILES)
+        for backend, profile in itertools.product(backends, profiles):
+            timings = []
+            sizes = []
+            with override_settings(
+                REPORT_CHART_BACKEND=backend, REPORT_OUTPUT_PROFILE=profile
+            ):
+                for _ in range(options["reports"]):
+                    if not options["cached"]:
+                        chart_cache.clear()
+                    started = time.perf_counter()
+                    pdf_buffer = generate_donor_report(
+                        donor, ReportData.from_donations(donations), BytesIO()
+                    )
+                    timings.append(time.perf_counter() - started)
+                    sizes.append(len(pdf_buffer.getvalue()))
+
+            self.stdout.write(
+                f"{backend:<10} {profile:<10} "
+                f"median {statistics.median(timings) * 1000:8.1f} ms  "
+                f"p95 {sorted(timings)[int(len(timings) * 0.95) - 1] * 1000:8.1f} ms  "
+                f"PDF {statistics.mean(sizes) / 1024:8.1f} KiB"
+            )
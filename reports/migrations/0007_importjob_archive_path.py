@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 11:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0006_importjob_content_hash_and_diff_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='archive_path',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
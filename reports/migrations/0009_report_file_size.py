@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 11:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0008_report_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='file_size',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
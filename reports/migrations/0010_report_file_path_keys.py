@@ -0,0 +1,45 @@
+from urllib.parse import unquote, urlsplit
+
+from django.core import signing
+from django.db import migrations
+
+
+def url_to_key(url):
+    """Turn a stored signed URL back into the storage key it points at."""
+    parts = urlsplit(url)
+    if not parts.scheme and not parts.path.startswith("/"):
+        # Already a key
+        return url
+
+    path = unquote(parts.path)
+    if "/files/" in path:
+        # Local and in-memory backend URLs carry the key in a signed token
+        token = path.rstrip("/").rsplit("/", 1)[-1]
+        try:
+            return signing.loads(token, salt="reports.storage")["key"]
+        except signing.BadSignature:
+            return url
+    if parts.netloc == "storage.googleapis.com":
+        # Path-style GCS URL: /<bucket>/<key>
+        return path.lstrip("/").split("/", 1)[1]
+    return path.lstrip("/")
+
+
+def convert_file_paths(apps, schema_editor):
+    Report = apps.get_model("reports", "Report")
+    reports = Report.objects.exclude(file_path="")
+    for report in reports.iterator():
+        key = url_to_key(report.file_path)
+        if key != report.file_path:
+            Report.objects.filter(pk=report.pk).update(file_path=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reports", "0009_report_file_size"),
+    ]
+
+    operations = [
+        migrations.RunPython(convert_file_paths, migrations.RunPython.noop),
+    ]
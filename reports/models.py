@@ -23,6 +23,43 @@ class Report(models.Model):
         max_length=20, choices=[("SUCCESS", "Success"), ("FAILED", "Failed")]
     )
     error_log = models.TextField(blank=True, null=True)
+    fingerprint = models.CharField(max_length=64, blank=True, db_index=True)
+    file_size = models.PositiveBigIntegerField(null=True, blank=True)
 
     def __str__(self):
         return f"Report for {self.donor.first_name} {self.donor.last_name} - {self.date_generated.strftime('%Y-%m-%d')}"
+
+
+class ImportJob(models.Model):
+    file_name = models.CharField(max_length=255)
+    file_path = models.TextField()
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    archive_path = models.TextField(blank=True, null=True)
+    status = models.CharField(
+        max_length=20,
+        choices=[
+            ("PENDING", "Pending"),
+            ("PROCESSING", "Processing"),
+            ("SUCCESS", "Success"),
+            ("FAILED", "Failed"),
+        ],
+        default="PENDING",
+    )
+    task_id = models.CharField(max_length=255, blank=True, null=True)
+    rows_processed = models.IntegerField(default=0)
+    rows_inserted = models.IntegerField(default=0)
+    rows_updated = models.IntegerField(default=0)
+    rows_unchanged = models.IntegerField(default=0)
+    rows_failed = models.IntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    report_group_id = models.CharField(max_length=255, blank=True, null=True)
+    reports_total = models.IntegerField(default=0)
+    reports_succeeded = models.IntegerField(default=0)
+    reports_skipped = models.IntegerField(default=0)
+    reports_failed = models.IntegerField(default=0)
+    error_log = models.TextField(blank=True, null=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_finished = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Import {self.pk} of {self.file_name} - {self.status}"
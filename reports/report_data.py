@@ -0,0 +1,182 @@
+import hashlib
+import json
+from collections import defaultdict
+from dataclasses import dataclass, field
+from itertools import groupby
+from operator import itemgetter
+from django.conf import settings
+from django.db.models import Count, F, Sum, Window
+from django.db.models.functions import RowNumber
+from donations.models import Donation
+
+# Columns of each donation table row
+ROW_FIELDS = ("donation_id", "cause__name", "amount", "date")
+
+# Donation columns a report depends on, hashed into its fingerprint
+FINGERPRINT_FIELDS = ("donation_id", "amount", "date", "cause__name")
+
+# Coarser and coarser labels used to bucket long date series
+BUCKET_LABELS = [
+    lambda date: "{}-W{:02d}".format(*date.isocalendar()[:2]),
+    lambda date: date.strftime("%Y-%m"),
+    lambda date: date.strftime("%Y"),
+]
+
+
+@dataclass
+class ReportData:
+    """
+    Everything generate_donor_report draws for one donor: totals per cause,
+    totals per date in date order, the overall count and amount, and the
+    donation table rows as (donation_id, cause name, amount, date) tuples.
+    Rows may be a lazy iterator, in which case they can only be read once.
+    """
+
+    cause_totals: dict = field(default_factory=dict)
+    date_totals: dict = field(default_factory=dict)
+    rows: object = ()
+    donation_count: int = 0
+    total_amount: object = 0
+
+    @classmethod
+    def from_aggregates(cls, aggregates, rows):
+        """Build from (date, cause name, total, count) groups ordered by date."""
+        cause_totals = defaultdict(int)
+        date_totals = defaultdict(int)
+        donation_count = 0
+        for date, cause_name, total, count in aggregates:
+            cause_totals[cause_name] += total
+            date_totals[date] += total
+            donation_count += count
+        return cls(
+            dict(cause_totals),
+            dict(date_totals),
+            rows,
+            donation_count,
+            sum(cause_totals.values()),
+        )
+
+    def date_series(self, max_points):
+        """
+        Return the date totals as (label, total) pairs. When there are more
+        than max_points dates they are bucketed by ISO week, then by month,
+        then by year, whichever first fits.
+        """
+        if len(self.date_totals) <= max_points:
+            return [
+                (date.strftime("%Y-%m-%d"), total)
+                for date, total in self.date_totals.items()
+            ]
+
+        for bucket_label in BUCKET_LABELS:
+            buckets = defaultdict(int)
+            for date, total in self.date_totals.items():
+                buckets[bucket_label(date)] += total
+            if len(buckets) <= max_points:
+                break
+        return list(buckets.items())
+
+    @classmethod
+    def from_donations(cls, donations):
+        """Build from Donation instances already in memory."""
+        donations = sorted(donations, key=lambda d: (d.date, d.donation_id))
+        rows = [
+            (d.donation_id, d.cause.name if d.cause else None, d.amount, d.date)
+            for d in donations
+        ]
+        return cls.from_aggregates(
+            [(date, cause_name, amount, 1) for _, cause_name, amount, date in rows],
+            rows,
+        )
+
+
+def _aggregate_query(donations, *group_by):
+    # One grouped query gives both the per-cause and the per-date totals
+    fields = (*group_by, "date", "cause__name")
+    return (
+        donations.values_list(*fields)
+        .annotate(total=Sum("amount"), count=Count("donation_id"))
+        .order_by(*fields)
+    )
+
+
+def _row_query(donations):
+    return donations.order_by("date", "donation_id").values_list(*ROW_FIELDS)
+
+
+def load_report_data(donor):
+    """Aggregate a donor's donations in the database and stream the table rows."""
+    donations = Donation.objects.filter(donor=donor)
+    # Rows past the table limit are summarised, so they are never fetched
+    rows = _row_query(donations)[: settings.REPORT_TABLE_MAX_ROWS]
+    return ReportData.from_aggregates(
+        _aggregate_query(donations),
+        rows.iterator(chunk_size=settings.REPORT_ROW_CHUNK_SIZE),
+    )
+
+
+def iter_report_data(donor_ids):
+    """
+    Yield (donor_id, ReportData) for each donor in donor_ids using two
+    queries in total. Table rows are streamed donor by donor, so each
+    donor's rows must be consumed before moving on to the next.
+    """
+    donations = Donation.objects.filter(donor_id__in=donor_ids)
+
+    aggregates = defaultdict(list)
+    for donor_id, *aggregate in _aggregate_query(donations, "donor_id"):
+        aggregates[donor_id].append(aggregate)
+
+    # Number each donor's rows in table order so rows past the table limit
+    # are never fetched, as in load_report_data
+    rows = (
+        donations.annotate(
+            row_number=Window(
+                RowNumber(),
+                partition_by=F("donor_id"),
+                order_by=[F("date").asc(), F("donation_id").asc()],
+            )
+        )
+        .filter(row_number__lte=settings.REPORT_TABLE_MAX_ROWS)
+        .order_by("donor_id", "date", "donation_id")
+        .values_list("donor_id", *ROW_FIELDS)
+        .iterator(chunk_size=settings.REPORT_ROW_CHUNK_SIZE)
+    )
+    seen = set()
+    for donor_id, donor_rows in groupby(rows, key=itemgetter(0)):
+        seen.add(donor_id)
+        yield donor_id, ReportData.from_aggregates(
+            aggregates[donor_id], (row[1:] for row in donor_rows)
+        )
+
+    # Donors without any donations still get a report
+    for donor_id in donor_ids:
+        if donor_id not in seen:
+            yield donor_id, ReportData()
+
+
+def report_fingerprints(donors, template_key):
+    """
+    Return {donor_id: fingerprint} for a {donor_id: Donor} dict. The
+    fingerprint hashes the template key, the donor's name and each donation's
+    id, amount, date and cause name, so it changes exactly when the rendered
+    report would. All donors are read with one streamed query.
+    """
+    digests = {}
+    for donor_id, donor in donors.items():
+        digest = hashlib.sha256()
+        digest.update(
+            json.dumps([template_key, donor.first_name, donor.last_name]).encode()
+        )
+        digests[donor_id] = digest
+
+    rows = (
+        Donation.objects.filter(donor_id__in=list(donors))
+        .order_by("donor_id", "donation_id")
+        .values_list("donor_id", *FINGERPRINT_FIELDS)
+        .iterator(chunk_size=settings.REPORT_ROW_CHUNK_SIZE)
+    )
+    for donor_id, *row in rows:
+        digests[donor_id].update(json.dumps(row, default=str).encode())
+
+    return {donor_id: digest.hexdigest() for donor_id, digest in digests.items()}
@@ -0,0 +1,81 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from .storage import get_storage
+
+# Set up a logger for this module
+logger = logging.getLogger(__name__)
+
+_urls = OrderedDict()
+_urls_lock = threading.Lock()
+
+
+def _cache_key(key):
+    return f"signed-url:{settings.REPORT_STORAGE_BACKEND}:{key}"
+
+
+def signed_url(key):
+    """Return a signed URL for one storage key; see signed_urls."""
+    return signed_urls([key])[key]
+
+
+def signed_urls(keys):
+    """
+    Return {key: signed URL} for storage keys. URLs are reused from this
+    process, then from the shared cache, until REPORT_URL_REFRESH_MARGIN
+    seconds before they expire; only the rest are signed, and the shared
+    cache is read and written once per call.
+    """
+    now = time.time()
+    urls = {}
+    with _urls_lock:
+        for key in keys:
+            entry = _urls.get(key)
+            if entry and entry[1] > now:
+                _urls.move_to_end(key)
+                urls[key] = entry[0]
+
+    missing = [key for key in keys if key not in urls]
+    if not missing:
+        return urls
+
+    try:
+        shared = cache.get_many([_cache_key(key) for key in missing])
+    except Exception as e:
+        logger.warning(f"Signed URL cache read failed: {e}")
+        shared = {}
+
+    # The shared cache expires entries itself, so anything found is fresh
+    signed = {}
+    fresh_until = now + settings.REPORT_URL_EXPIRY - settings.REPORT_URL_REFRESH_MARGIN
+    storage = get_storage()
+    for key in missing:
+        entry = shared.get(_cache_key(key))
+        if entry:
+            urls[key] = entry[0]
+            _remember(key, *entry)
+        else:
+            urls[key] = storage.sign_url(key, settings.REPORT_URL_EXPIRY)
+            signed[_cache_key(key)] = (urls[key], fresh_until)
+            _remember(key, urls[key], fresh_until)
+
+    if signed:
+        try:
+            cache.set_many(
+                signed,
+                timeout=settings.REPORT_URL_EXPIRY - settings.REPORT_URL_REFRESH_MARGIN,
+            )
+        except Exception as e:
+            logger.warning(f"Signed URL cache write failed: {e}")
+    return urls
+
+
+def _remember(key, url, fresh_until):
+    with _urls_lock:
+        _urls[key] = (url, fresh_until)
+        _urls.move_to_end(key)
+        while len(_urls) > settings.SIGNED_URL_CACHE_SIZE:
+            _urls.popitem(last=False)
@@ -0,0 +1,191 @@
+import logging
+import os
+import shutil
+import threading
+import time
+from io import BytesIO
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+from google.api_core.exceptions import NotFound
+from .gcs import get_gcs_bucket, record_upload
+
+# Set up a logger for this module
+logger = logging.getLogger(__name__)
+
+# Salt for the tokens behind local and in-memory file URLs
+SIGNING_SALT = "reports.storage"
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def signed_file_url(key, expires_in):
+    """URL of the report-file view for key, valid for expires_in seconds."""
+    token = signing.dumps(
+        {"key": key, "expires": int(time.time()) + expires_in}, salt=SIGNING_SALT
+    )
+    path = reverse("report-file", kwargs={"token": token})
+    return f"{settings.REPORT_STORAGE_BASE_URL}{path}"
+
+
+def read_chunks(fileobj, length=None):
+    """Yield up to length bytes (or everything) from fileobj in chunks."""
+    remaining = length
+    while remaining is None or remaining > 0:
+        size = STREAM_CHUNK_SIZE
+        if remaining is not None:
+            size = min(remaining, size)
+        chunk = fileobj.read(size)
+        if not chunk:
+            return
+        if remaining is not None:
+            remaining -= len(chunk)
+        yield chunk
+
+
+def key_from_token(token):
+    """
+    Return the key a signed_file_url token points at. Raises
+    signing.BadSignature for tampered or expired tokens.
+    """
+    payload = signing.loads(token, salt=SIGNING_SALT)
+    if payload["expires"] < time.time():
+        raise signing.BadSignature("File URL has expired.")
+    return payload["key"]
+
+
+class GCSStorage:
+    """Files stored in the GS_BUCKET_NAME bucket, uploaded in resumable chunks."""
+
+    def _blob(self, key):
+        return get_gcs_bucket().blob(key, chunk_size=settings.GS_UPLOAD_CHUNK_SIZE)
+
+    def put(self, key, fileobj, content_type="application/pdf"):
+        fileobj.seek(0)
+        started = time.perf_counter()
+        self._blob(key).upload_from_file(fileobj, content_type=content_type)
+        record_upload(time.perf_counter() - started)
+
+    def get(self, key):
+        return self._blob(key).download_as_bytes()
+
+    def stream(self, key, start=0, length=None):
+        with self._blob(key).open("rb", chunk_size=STREAM_CHUNK_SIZE) as blob_file:
+            blob_file.seek(start)
+            yield from read_chunks(blob_file, length)
+
+    def size(self, key):
+        blob = get_gcs_bucket().blob(key)
+        try:
+            blob.reload()
+        except NotFound:
+            raise FileNotFoundError(key) from None
+        return blob.size
+
+    def exists(self, key):
+        return self._blob(key).exists()
+
+    def sign_url(self, key, expires_in):
+        return self._blob(key).generate_signed_url(
+            version="v4", expiration=expires_in, method="GET"
+        )
+
+
+class LocalStorage:
+    """Files stored under a local directory and served by the report-file view."""
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.directory, key))
+        if os.path.commonpath([path, self.directory]) != self.directory:
+            raise ValueError(f"Storage key escapes the storage directory: {key}")
+        return path
+
+    def put(self, key, fileobj, content_type="application/pdf"):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write under a temporary name so readers never see a partial file
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        fileobj.seek(0)
+        with open(temp_path, "wb") as stored_file:
+            shutil.copyfileobj(fileobj, stored_file)
+        os.replace(temp_path, path)
+
+    def get(self, key):
+        with open(self._path(key), "rb") as stored_file:
+            return stored_file.read()
+
+    def stream(self, key, start=0, length=None):
+        with open(self._path(key), "rb") as stored_file:
+            stored_file.seek(start)
+            yield from read_chunks(stored_file, length)
+
+    def size(self, key):
+        return os.path.getsize(self._path(key))
+
+    def exists(self, key):
+        return os.path.isfile(self._path(key))
+
+    def sign_url(self, key, expires_in):
+        return signed_file_url(key, expires_in)
+
+
+class InMemoryStorage:
+    """Files kept in this process's memory, for tests and offline benchmarks."""
+
+    def __init__(self):
+        self.files = {}
+        self.lock = threading.Lock()
+
+    def put(self, key, fileobj, content_type="application/pdf"):
+        fileobj.seek(0)
+        data = fileobj.read()
+        with self.lock:
+            self.files[key] = data
+
+    def get(self, key):
+        with self.lock:
+            try:
+                return self.files[key]
+            except KeyError:
+                raise FileNotFoundError(key) from None
+
+    def stream(self, key, start=0, length=None):
+        data = BytesIO(self.get(key))
+        data.seek(start)
+        yield from read_chunks(data, length)
+
+    def size(self, key):
+        return len(self.get(key))
+
+    def exists(self, key):
+        with self.lock:
+            return key in self.files
+
+    def sign_url(self, key, expires_in):
+        return signed_file_url(key, expires_in)
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """Return this process's storage backend, chosen by REPORT_STORAGE_BACKEND."""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = _build_storage()
+    return _storage
+
+
+def _build_storage():
+    backend = settings.REPORT_STORAGE_BACKEND
+    if backend == "gcs":
+        return GCSStorage()
+    if backend == "local":
+        return LocalStorage(settings.REPORT_STORAGE_DIR)
+    if backend == "memory":
+        return InMemoryStorage()
+    raise ValueError(f"Unknown report storage backend: {backend}")
@@ -1,99 +1,208 @@
 import os
+import importlib
 import logging
 import re
-from celery import shared_task, current_task
-from google.cloud import storage
-from google.oauth2 import service_account
+import tempfile
+import time
+from celery import group, shared_task, current_task
 from django.conf import settings
-from donations.models import Donor, Donation
-from .models import Report
-from .utils import generate_donor_report
+from django.db.models import F
+from django.utils import timezone
+from donations.models import Donor
+from .chart_cache import get_chart_cache
+from .gcs import gcs_client_stats, get_gcs_bucket
+from .ingestion import ingest_frames, read_frames
+from .models import ImportJob, Report
+from .storage import GCSStorage, get_storage
+from .report_data import iter_report_data, load_report_data, report_fingerprints
+from .utils import (
+    generate_donor_report,
+    load_report_assets,
+    report_template_key,
+    warm_up_charts,
+)
 from django.core.files.base import ContentFile
 
 # Set up a logger for this module
 logger = logging.getLogger(__name__)
 
+# Modules imported on first use deep inside the libraries tasks rely on; not
+# every library version has all of them
+WARM_UP_MODULES = [
+    "pandas.io.parsers",
+    "openpyxl.reader.excel",
+    "reportlab.graphics.renderPDF",
+    "reportlab.pdfbase.pdfmetrics",
+    "google.auth.transport.requests",
+    "google.resumable_media.requests",
+]
 
-def upload_report_to_gcs(report_file, file_name):
+
+def warm_up_worker():
+    """
+    Do the one-off work a worker process would otherwise pay for in its first
+    task: import lazily loaded modules, load matplotlib's fonts and render a
+    throwaway chart, load report assets and open the storage client.
+    Returns the time taken in seconds.
+    """
+    started = time.perf_counter()
+    for module in WARM_UP_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            logger.info(f"Skipping warm-up import of {module}: {e}")
+    warm_up_charts()
+    load_report_assets()
     try:
-        # Load credentials explicitly using the environment variable
-        credentials_path = os.getenv("GS_CREDENTIALS")
-        if not credentials_path:
-            raise ValueError(
-                "Google Cloud credentials path not found in environment variables."
-            )
+        if isinstance(get_storage(), GCSStorage):
+            get_gcs_bucket()
+    except Exception as e:
+        logger.warning(f"Storage client could not be opened during warm-up: {e}")
 
-        logger.info(f"Loading Google Cloud credentials from: {credentials_path}")
+    elapsed = time.perf_counter() - started
+    logger.info(f"Worker process {os.getpid()} warmed up in {elapsed:.2f}s")
+    return elapsed
 
-        # Load the credentials
-        credentials = service_account.Credentials.from_service_account_file(
-            credentials_path
-        )
 
-        # Initialize the Google Cloud Storage client
-        client = storage.Client(credentials=credentials)
-        bucket_name = settings.GS_BUCKET_NAME
-        bucket = client.bucket(bucket_name)
+def upload_report(report_file, key):
+    try:
+        # Store the file with the configured backend, streamed in chunks;
+        # URLs are signed when the report is read, not here
+        get_storage().put(key, report_file, content_type="application/pdf")
+
+        logger.info(f"File uploaded successfully: {key}")
+        return key
 
-        # Create a blob for the file and upload it
-        blob = bucket.blob(f"charity_reports/{file_name}")
+    except Exception as e:
+        logger.error(f"Failed to upload report: {e}")
+        # Raise the caught exception instead of creating a new one without a specific type
+        raise
 
-        # Ensure the file pointer is at the beginning
-        report_file.seek(0)
-        blob.upload_from_file(report_file, content_type="application/pdf")
 
-        # Generate a signed URL valid for 7 days
-        signed_url = blob.generate_signed_url(
-            version="v4", expiration=604800, method="GET"  # 7 days in seconds
-        )
+def report_file_name(donor):
+    # Sanitize file name
+    safe_first_name = re.sub(r"[^a-zA-Z0-9_-]", "", donor.first_name.lower())
+    safe_last_name = re.sub(r"[^a-zA-Z0-9_-]", "", donor.last_name.lower())
+    return f"{donor.donor_id}_{safe_first_name}_{safe_last_name}_report.pdf"
 
-        logger.info(f"File uploaded successfully to GCS: {signed_url}")
-        return signed_url
 
-    except Exception as e:
-        logger.error(f"Failed to upload report to GCS: {e}")
-        # Raise the caught exception instead of creating a new one without a specific type
+def report_key(donor):
+    # Where a donor's latest report is kept in storage
+    return f"charity_reports/{report_file_name(donor)}"
+
+
+def write_report_artifact(donor, report_data):
+    """
+    Render a donor's report into REPORT_ARTIFACT_DIR for the upload stage and
+    return the file's path and size.
+    """
+    os.makedirs(settings.REPORT_ARTIFACT_DIR, exist_ok=True)
+    artifact = tempfile.NamedTemporaryFile(
+        dir=settings.REPORT_ARTIFACT_DIR,
+        prefix=f"{donor.donor_id}_",
+        suffix=".pdf",
+        delete=False,
+    )
+    try:
+        with artifact:
+            generate_donor_report(donor, report_data, artifact)
+            file_size = artifact.seek(0, os.SEEK_END)
+    except Exception:
+        os.remove(artifact.name)
         raise
+    return artifact.name, file_size
+
+
+def queue_donor_reports(donor_ids, force=False, job_id=None):
+    """
+    Queue report generation in batches of REPORT_BATCH_SIZE donors as one
+    Celery group, published over a single broker connection. Returns the
+    GroupResult, saved to the result backend so GroupResult.restore can find
+    it by id, or None when there is nothing to queue.
+    """
+    donor_ids = list(donor_ids)
+    if not donor_ids:
+        return None
+    batch_size = settings.REPORT_BATCH_SIZE
+    report_group = group(
+        process_donor_report_batch.s(
+            donor_ids[start : start + batch_size], force=force, job_id=job_id
+        )
+        for start in range(0, len(donor_ids), batch_size)
+    ).apply_async()
+    report_group.save()
+    return report_group
+
+
+def count_reports(job_id, **counts):
+    # Add to an import job's report counters; workers update them concurrently
+    if job_id is None:
+        return
+    updates = {
+        f"reports_{outcome}": F(f"reports_{outcome}") + count
+        for outcome, count in counts.items()
+        if count
+    }
+    if updates:
+        ImportJob.objects.filter(pk=job_id).update(**updates)
+
+
+def latest_report_fingerprints(donor_ids):
+    """Return {donor_id: fingerprint} of each donor's latest successful report."""
+    reports = (
+        Report.objects.filter(donor_id__in=donor_ids, status="SUCCESS")
+        .order_by("date_generated", "pk")
+        .values_list("donor_id", "fingerprint")
+    )
+    # Later reports overwrite earlier ones, leaving the latest per donor
+    return dict(reports)
 
 
 @shared_task(bind=True)
-def process_donor_report(self, donor_id):
+def process_donor_report(self, donor_id, force=False):
     donor = None
     try:
         logger.info(f"Starting report generation for donor ID: {donor_id}")
         # Update task state to indicate the start of the process
         self.update_state(state="STARTED", meta={"progress": 10})
 
-        # Retrieve the donor and donations
+        # Retrieve the donor and fingerprint the inputs of their report
         donor = Donor.objects.get(donor_id=donor_id)
-        donations = Donation.objects.filter(donor=donor)
-
-        # Generate the report
-        pdf_buffer = generate_donor_report(donor, donations)
-        logger.info(f"Report generated successfully for donor ID: {donor_id}")
+        fingerprint = report_fingerprints(
+            {donor.donor_id: donor}, report_template_key()
+        )[donor.donor_id]
 
-        # Update progress
-        self.update_state(state="PROGRESS", meta={"progress": 50})
+        # Reuse the last successful report when nothing it shows has changed
+        last_report = (
+            Report.objects.filter(donor=donor, status="SUCCESS")
+            .order_by("-date_generated", "-pk")
+            .first()
+        )
+        if not force and last_report and last_report.fingerprint == fingerprint:
+            logger.info(
+                f"Report inputs unchanged for donor ID {donor_id}, "
+                f"reusing report {last_report.pk}"
+            )
+            self.update_state(state="SUCCESS", meta={"progress": 100})
+            return f"Report for {donor.donor_id} is up to date."
 
-        # Sanitize file name
-        safe_first_name = re.sub(r"[^a-zA-Z0-9_-]", "", donor.first_name.lower())
-        safe_last_name = re.sub(r"[^a-zA-Z0-9_-]", "", donor.last_name.lower())
-        file_name = f"{donor.donor_id}_{safe_first_name}_{safe_last_name}_report.pdf"
+        report_data = load_report_data(donor)
 
-        # Upload the report to GCS
-        public_url = upload_report_to_gcs(pdf_buffer, file_name)
-        logger.info(f"Report uploaded to GCS successfully. URL: {public_url}")
+        # Render the report and hand it to the upload stage
+        artifact_path, file_size = write_report_artifact(donor, report_data)
+        logger.info(f"Report generated successfully for donor ID: {donor_id}")
+        logger.debug(f"Chart cache stats: {get_chart_cache().stats()}")
 
         # Update progress
         self.update_state(state="PROGRESS", meta={"progress": 90})
 
-        # Save the report's URL in the database
-        Report.objects.create(donor=donor, file_path=public_url, status="SUCCESS")
-        logger.info(f"Report entry created in the database for donor ID: {donor_id}")
+        upload_task = upload_donor_report.delay(
+            donor.donor_id, artifact_path, fingerprint, file_size
+        )
 
         # Final progress update
         self.update_state(state="SUCCESS", meta={"progress": 100})
-        return f"Report for {donor.donor_id} generated successfully."
+        return f"Report for {donor.donor_id} rendered, upload task {upload_task.id}."
 
     except Donor.DoesNotExist as e:
         logger.error(f"Donor with ID {donor_id} does not exist.")
@@ -109,3 +218,230 @@ def process_donor_report(self, donor_id):
             )
         # Raising the exception so that Celery can handle it and mark the task as failed
         raise
+
+
+@shared_task(bind=True)
+def process_donor_report_batch(self, donor_ids, force=False, job_id=None):
+    logger.info(f"Starting batch report generation for {len(donor_ids)} donors")
+    self.update_state(state="PROGRESS", meta={"progress": 0})
+
+    results = {}
+    try:
+        # Load every donor up front; donations are aggregated and streamed
+        # per donor
+        donors = Donor.objects.in_bulk(donor_ids)
+        fingerprints = report_fingerprints(donors, report_template_key())
+
+        # Skip donors whose last successful report was built from the same
+        # inputs
+        if not force:
+            for donor_id, fingerprint in latest_report_fingerprints(
+                list(donors)
+            ).items():
+                if fingerprints[donor_id] == fingerprint:
+                    results[donor_id] = {"status": "SKIPPED"}
+        to_render = [donor_id for donor_id in donor_ids if donor_id not in results]
+
+        progress_every = max(len(donor_ids) // 10, 1)
+
+        for position, (donor_id, report_data) in enumerate(
+            iter_report_data(to_render), start=len(results) + 1
+        ):
+            donor = donors.get(donor_id)
+            if donor is None:
+                logger.error(f"Donor with ID {donor_id} does not exist.")
+                results[donor_id] = {
+                    "status": "FAILED",
+                    "error": "Donor does not exist.",
+                }
+                continue
+
+            try:
+                artifact_path, file_size = write_report_artifact(donor, report_data)
+
+            except Exception as e:
+                logger.error(f"Failed to generate report for donor ID {donor_id}: {e}")
+                Report.objects.create(
+                    donor=donor, file_path="", status="FAILED", error_log=str(e)
+                )
+                results[donor_id] = {"status": "FAILED", "error": str(e)}
+
+            else:
+                # Upload failures are recorded by the upload task itself
+                upload_task = upload_donor_report.delay(
+                    donor_id, artifact_path, fingerprints[donor_id], file_size, job_id
+                )
+                results[donor_id] = {
+                    "status": "RENDERED",
+                    "upload_task_id": upload_task.id,
+                }
+
+            if position % progress_every == 0:
+                self.update_state(
+                    state="PROGRESS",
+                    meta={"progress": int(position / len(donor_ids) * 100)},
+                )
+
+    finally:
+        statuses = [result["status"] for result in results.values()]
+        # Rendered reports are counted by their upload task. Donors the batch
+        # never reached, because it raised partway, count as failed so the
+        # job's counters still add up to reports_total
+        unprocessed = len(set(donor_ids) - set(results))
+        count_reports(
+            job_id,
+            skipped=statuses.count("SKIPPED"),
+            failed=statuses.count("FAILED") + unprocessed,
+        )
+
+    logger.info(
+        f"Batch report generation finished: {statuses.count('RENDERED')} rendered, "
+        f"{statuses.count('SKIPPED')} unchanged, {statuses.count('FAILED')} failed"
+    )
+    logger.debug(f"Chart cache stats: {get_chart_cache().stats()}")
+    return results
+
+
+@shared_task(bind=True, max_retries=settings.REPORT_UPLOAD_MAX_RETRIES)
+def upload_donor_report(
+    self, donor_id, artifact_path, fingerprint, file_size, job_id=None
+):
+    donor = None
+    try:
+        donor = Donor.objects.get(donor_id=donor_id)
+
+        # Upload the rendered report to storage
+        with open(artifact_path, "rb") as pdf_file:
+            key = upload_report(pdf_file, report_key(donor))
+        logger.info(f"Report uploaded successfully. Key: {key}")
+        logger.debug(f"Storage client stats: {gcs_client_stats()}")
+
+        # Save the report's storage key in the database
+        Report.objects.create(
+            donor=donor,
+            file_path=key,
+            status="SUCCESS",
+            fingerprint=fingerprint,
+            file_size=file_size,
+        )
+        logger.info(f"Report entry created in the database for donor ID: {donor_id}")
+        count_reports(job_id, succeeded=1)
+
+    except Exception as e:
+        # Retry transient failures, keeping the artifact for the next attempt
+        retryable = not isinstance(e, (Donor.DoesNotExist, FileNotFoundError))
+        if retryable and self.request.retries < self.max_retries:
+            logger.warning(
+                f"Upload of report for donor ID {donor_id} failed, retrying: {e}"
+            )
+            raise self.retry(
+                exc=e,
+                countdown=settings.REPORT_UPLOAD_RETRY_DELAY * 2**self.request.retries,
+            )
+
+        logger.error(f"Failed to upload report for donor ID {donor_id}: {e}")
+        if donor:
+            Report.objects.create(
+                donor=donor, file_path="", status="FAILED", error_log=str(e)
+            )
+        count_reports(job_id, failed=1)
+        remove_artifact(artifact_path)
+        raise
+
+    # The artifact is only needed until it is in storage
+    remove_artifact(artifact_path)
+    return f"Report for {donor_id} uploaded successfully."
+
+
+def remove_artifact(artifact_path):
+    try:
+        os.remove(artifact_path)
+    except FileNotFoundError:
+        pass
+
+
+@shared_task(bind=True)
+def process_import_job(self, job_id):
+    job = ImportJob.objects.get(pk=job_id)
+    file_extension = job.file_name.split(".")[-1].lower()
+
+    try:
+        logger.info(f"Starting import job {job_id} for {job.file_name}")
+        ImportJob.objects.filter(pk=job_id).update(status="PROCESSING")
+        self.update_state(state="PROGRESS", meta={"progress": 10})
+
+        # Parse the spooled upload straight from local disk
+        with open(job.file_path, "rb") as raw_file:
+            file_size = os.path.getsize(job.file_path) or 1
+
+            def record_progress(result):
+                # Parsing covers 10-80% of the job, estimated from the file position
+                parsed = min(raw_file.tell() / file_size, 1)
+                ImportJob.objects.filter(pk=job_id).update(
+                    rows_processed=result.rows_imported,
+                    rows_failed=result.rows_failed,
+                )
+                self.update_state(
+                    state="PROGRESS", meta={"progress": 10 + int(parsed * 70)}
+                )
+
+            result = ingest_frames(
+                read_frames(raw_file, file_extension), progress=record_progress
+            )
+
+        ImportJob.objects.filter(pk=job_id).update(
+            rows_processed=result.rows_imported,
+            rows_inserted=result.rows_inserted,
+            rows_updated=result.rows_updated,
+            rows_unchanged=result.rows_unchanged,
+            rows_failed=result.rows_failed,
+            errors=result.errors,
+        )
+        self.update_state(state="PROGRESS", meta={"progress": 80})
+
+        # Trigger report generation for each donor whose donations changed,
+        # setting the total first so workers' counters never run ahead of it
+        ImportJob.objects.filter(pk=job_id).update(
+            reports_total=len(result.donor_ids)
+        )
+        report_group = queue_donor_reports(result.donor_ids, job_id=job_id)
+
+        ImportJob.objects.filter(pk=job_id).update(
+            status="SUCCESS",
+            report_group_id=report_group.id if report_group else None,
+            date_finished=timezone.now(),
+        )
+        logger.info(
+            f"Import job {job_id} finished: {result.rows_inserted} rows inserted, "
+            f"{result.rows_updated} updated, {result.rows_unchanged} unchanged, "
+            f"{result.rows_failed} failed, {len(result.donor_ids)} reports queued"
+        )
+        return f"Imported {result.rows_imported} rows from {job.file_name}."
+
+    except Exception as e:
+        logger.error(f"Import job {job_id} failed: {e}")
+        ImportJob.objects.filter(pk=job_id).update(
+            status="FAILED", error_log=str(e), date_finished=timezone.now()
+        )
+        raise
+
+    finally:
+        # Archive the upload in the background, or drop the spooled copy
+        if settings.INGEST_ARCHIVE_UPLOADS:
+            archive_import_file.delay(job_id)
+        else:
+            os.remove(job.file_path)
+
+
+@shared_task
+def archive_import_file(job_id):
+    job = ImportJob.objects.get(pk=job_id)
+    archive_path = f"imports/{job.pk}/{os.path.basename(job.file_path)}"
+
+    with open(job.file_path, "rb") as spooled_file:
+        get_storage().put(
+            archive_path, spooled_file, content_type="application/octet-stream"
+        )
+    ImportJob.objects.filter(pk=job_id).update(archive_path=archive_path)
+    os.remove(job.file_path)
+    logger.info(f"Archived upload for import job {job_id} to {archive_path}")
@@ -1,3 +1,649 @@
-from django.test import TestCase
+import importlib
+import os
+import tempfile
+from io import BytesIO
+from unittest import mock
+import openpyxl
+import pandas as pd
+from datetime import datetime, timezone
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from donations.models import Donor, Donation
+from .chart_cache import DiskChartStore
+from .ingestion import (
+    build_batch,
+    diff_donations,
+    ingest_frames,
+    read_csv_chunks,
+    read_frames,
+    validate_frame,
+)
+from .models import Cause, ImportJob, Report
+from .report_data import iter_report_data, load_report_data, report_fingerprints
+from .storage import InMemoryStorage, signed_file_url
+from .tasks import (
+    process_donor_report,
+    process_donor_report_batch,
+    process_import_job,
+    upload_donor_report,
+    warm_up_worker,
+)
+from .utils import report_template_key
+from .views import byte_range, storage_file_response
 
-# Create your tests here.
+
+def donation_rows(count=1, **overrides):
+    """Rows in the upload format with the required columns filled in."""
+    rows = []
+    for number in range(1, count + 1):
+        row = {
+            "Donor ID": "1001",
+            "Donation ID": f"D{number}",
+            "Donor First Name": "Ada",
+            "Donor Last Name": "Lovelace",
+            "Donor Email": "ada@example.com",
+            "Donation Amount": "25.00",
+            "Date of Donation": "2024-01-15",
+            "Time of Donation": "02:30 PM",
+            "Cause ID": "C1",
+            "Cause": "Clean Water",
+            "Payment Type": "Card",
+            "Recurrence Status": "one-time",
+        }
+        row.update(overrides)
+        rows.append(row)
+    return rows
+
+
+def csv_file(rows, encoding="utf-8"):
+    return BytesIO(pd.DataFrame(rows).to_csv(index=False).encode(encoding))
+
+
+class IngestFramesTests(TestCase):
+    def test_optional_columns_missing_keep_stored_values(self):
+        ingest_frames(
+            [
+                pd.DataFrame(
+                    donation_rows(
+                        **{
+                            "Phone Number": "555-0100",
+                            "Address": "12 Analytical St",
+                            "Description": "Wells and pumps",
+                            "Images": ["well.jpg"],
+                        }
+                    )
+                )
+            ]
+        )
+
+        ingest_frames([pd.DataFrame(donation_rows(**{"Donor Last Name": "King"}))])
+
+        donor = Donor.objects.get(donor_id="1001")
+        self.assertEqual(donor.last_name, "King")
+        self.assertEqual(donor.phone, "555-0100")
+        self.assertEqual(donor.address, "12 Analytical St")
+        cause = Cause.objects.get(cause_id="C1")
+        self.assertEqual(cause.description, "Wells and pumps")
+        self.assertEqual(cause.images, ["well.jpg"])
+
+    def test_optional_columns_present_are_updated(self):
+        ingest_frames([pd.DataFrame(donation_rows(**{"Phone Number": "555-0100"}))])
+        ingest_frames([pd.DataFrame(donation_rows(**{"Phone Number": "555-0199"}))])
+
+        self.assertEqual(Donor.objects.get(donor_id="1001").phone, "555-0199")
+        self.assertEqual(Donation.objects.count(), 1)
+
+    def test_blank_id_in_one_chunk_keeps_ids_as_text(self):
+        rows = donation_rows(4)
+        rows[2]["Donor ID"] = ""
+
+        result = ingest_frames(read_csv_chunks(csv_file(rows), chunk_size=2))
+
+        self.assertEqual(result.rows_imported, 3)
+        self.assertEqual(result.errors[0]["row"], 4)
+        self.assertEqual(result.errors[0]["errors"], ["Missing Donor ID"])
+        self.assertEqual(
+            list(Donor.objects.values_list("donor_id", flat=True)), ["1001"]
+        )
+
+    def test_blank_donation_id_is_reported(self):
+        rows = donation_rows(2)
+        rows[0]["Donation ID"] = ""
+
+        result = ingest_frames(read_csv_chunks(csv_file(rows)))
+
+        self.assertEqual(result.rows_imported, 1)
+        self.assertEqual(
+            result.errors,
+            [{"row": 2, "donation_id": None, "errors": ["Missing Donation ID"]}],
+        )
+        self.assertEqual(
+            list(Donation.objects.values_list("donation_id", flat=True)), ["D2"]
+        )
+
+    @override_settings(INGEST_EXCEL_ALL_SHEETS=False, INGEST_XLSX_STREAMING=False)
+    def test_blank_id_in_excel_keeps_ids_as_text(self):
+        # Numeric ids as Excel stores them, with one left blank
+        rows = donation_rows(2, **{"Donor ID": 1001})
+        rows[1]["Donor ID"] = None
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(list(rows[0]))
+        for row in rows:
+            sheet.append(list(row.values()))
+        workbook_file = BytesIO()
+        workbook.save(workbook_file)
+        workbook_file.seek(0)
+
+        ingest_frames(read_frames(workbook_file, "xlsx"))
+
+        self.assertEqual(
+            list(Donor.objects.values_list("donor_id", flat=True)), ["1001"]
+        )
+
+    def test_non_utf8_csv_files(self):
+        for encoding in ["cp1252", "utf-16"]:
+            with self.subTest(encoding=encoding), tempfile.TemporaryFile() as upload:
+                upload.write(
+                    csv_file(
+                        donation_rows(**{"Donor First Name": "Zoë"}), encoding
+                    ).getvalue()
+                )
+                upload.seek(0)
+
+                result = ingest_frames(read_frames(upload, "csv"))
+
+                self.assertEqual(result.rows_failed, 0)
+                self.assertEqual(Donor.objects.get(donor_id="1001").first_name, "Zoë")
+
+    def test_blank_cells(self):
+        rows = donation_rows(2)
+        rows[1].update({"Payment Type": None, "Recurrence Status": None})
+
+        result = ingest_frames([pd.DataFrame(rows)])
+
+        self.assertEqual(result.rows_imported, 2)
+        donation = Donation.objects.get(donation_id="D2")
+        self.assertEqual(donation.payment_type, "")
+        self.assertEqual(donation.recurrence, "")
+        self.assertIsNone(Donor.objects.get(donor_id="1001").phone)
+
+    def test_blank_required_cells_are_reported(self):
+        rows = donation_rows(3)
+        rows[0]["Donation Amount"] = ""
+        rows[1]["Date of Donation"] = ""
+
+        result = ingest_frames(read_csv_chunks(csv_file(rows)))
+
+        self.assertEqual(result.rows_imported, 1)
+        self.assertEqual(
+            [(error["row"], error["errors"]) for error in result.errors],
+            [
+                (2, ["Invalid Donation Amount"]),
+                (3, ["Invalid Date of Donation, expected YYYY-MM-DD"]),
+            ],
+        )
+
+
+class ValidateFrameTests(TestCase):
+    def test_duplicate_donation_ids_across_chunks(self):
+        seen = set()
+        validate_frame(pd.DataFrame(donation_rows(2)), seen)
+
+        valid, errors = validate_frame(pd.DataFrame(donation_rows(3)), seen)
+
+        self.assertEqual(list(valid["Donation ID"]), ["D3"])
+        self.assertEqual([error["donation_id"] for error in errors], ["D1", "D2"])
+        self.assertEqual(seen, {"D1", "D2", "D3"})
+
+
+class DiffDonationsTests(TestCase):
+    def setUp(self):
+        ingest_frames([pd.DataFrame(donation_rows(2))])
+
+    def donations(self, rows):
+        valid, errors = validate_frame(pd.DataFrame(rows))
+        self.assertEqual(errors, [])
+        return build_batch(valid.to_dict("records"))[2]
+
+    def test_inserts_updates_and_unchanged_rows(self):
+        rows = donation_rows(3)
+        rows[1]["Donation Amount"] = "30.00"
+
+        inserts, updates, unchanged, changed_donor_ids = diff_donations(
+            self.donations(rows)
+        )
+
+        self.assertEqual([d.donation_id for d in inserts], ["D3"])
+        self.assertEqual([d.donation_id for d in updates], ["D2"])
+        self.assertEqual([d.donation_id for d in unchanged], ["D1"])
+        self.assertEqual(changed_donor_ids, {"1001"})
+
+    def test_unchanged_file_changes_no_donors(self):
+        *_, changed_donor_ids = diff_donations(self.donations(donation_rows(2)))
+
+        self.assertEqual(changed_donor_ids, set())
+
+    def test_moved_donation_requeues_both_donors(self):
+        rows = donation_rows(2)
+        rows[1]["Donor ID"] = "1002"
+
+        result = ingest_frames([pd.DataFrame(rows)])
+
+        self.assertEqual(
+            (result.rows_inserted, result.rows_updated, result.rows_unchanged),
+            (0, 1, 1),
+        )
+        self.assertEqual(sorted(result.donor_ids), ["1001", "1002"])
+        self.assertEqual(Donation.objects.get(donation_id="D2").donor_id, "1002")
+
+
+class FileUploadViewTests(TestCase):
+    def setUp(self):
+        spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spool_dir.cleanup)
+        self.spool_dir = spool_dir.name
+        settings_override = override_settings(INGEST_SPOOL_DIR=self.spool_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload(self):
+        upload = SimpleUploadedFile(
+            "donations.csv", csv_file(donation_rows()).getvalue()
+        )
+        return self.client.post("/api/reports/upload/", {"file": upload})
+
+    def test_job_that_could_not_be_queued_does_not_block_the_file(self):
+        with mock.patch.object(
+            process_import_job, "apply_async", side_effect=ConnectionError("broker")
+        ):
+            response = self.upload()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(
+            list(ImportJob.objects.values_list("status", flat=True)), ["FAILED"]
+        )
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+        with mock.patch.object(process_import_job, "apply_async") as apply_async:
+            response = self.upload()
+
+        self.assertEqual(response.status_code, 202)
+        apply_async.assert_called_once()
+        self.assertEqual(ImportJob.objects.count(), 2)
+
+    def test_identical_file_is_not_imported_twice(self):
+        with mock.patch.object(process_import_job, "apply_async") as apply_async:
+            first = self.upload()
+            second = self.upload()
+
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()["job_id"], first.json()["job_id"])
+        apply_async.assert_called_once()
+
+
+@mock.patch.object(process_donor_report, "update_state")
+@mock.patch.object(process_donor_report_batch, "update_state")
+@mock.patch("reports.tasks.upload_donor_report.delay")
+@mock.patch("reports.tasks.write_report_artifact", return_value=("report.pdf", 10))
+class ReportReuseTests(TestCase):
+    def setUp(self):
+        rows = donation_rows(**{"Donor ID": "1002", "Donation ID": "D2"})
+        ingest_frames([pd.DataFrame(donation_rows() + rows)])
+        self.donor_ids = ["1001", "1002"]
+
+    def record_reports(self, legacy=False):
+        # A successful report per donor, built from their current inputs
+        donors = Donor.objects.in_bulk(self.donor_ids)
+        fingerprints = report_fingerprints(donors, report_template_key())
+        for donor_id, donor in donors.items():
+            Report.objects.create(
+                donor=donor,
+                file_path=f"charity_reports/{donor_id}.pdf",
+                status="SUCCESS",
+                # Reports from before fingerprinting have a blank one
+                fingerprint="" if legacy else fingerprints[donor_id],
+            )
+
+    def statuses(self, **kwargs):
+        results = process_donor_report_batch(self.donor_ids, **kwargs)
+        return {donor_id: result["status"] for donor_id, result in results.items()}
+
+    def test_same_inputs_are_skipped(self, write_artifact, *mocks):
+        self.record_reports()
+
+        self.assertEqual(self.statuses(), {"1001": "SKIPPED", "1002": "SKIPPED"})
+        self.assertIn("up to date", process_donor_report("1001"))
+        write_artifact.assert_not_called()
+
+    def test_changed_amount_is_rendered(self, write_artifact, *mocks):
+        self.record_reports()
+        Donation.objects.filter(donation_id="D1").update(amount="30.00")
+
+        self.assertEqual(self.statuses(), {"1001": "RENDERED", "1002": "SKIPPED"})
+
+    def test_changed_cause_name_is_rendered(self, write_artifact, *mocks):
+        self.record_reports()
+        Cause.objects.filter(cause_id="C1").update(name="Clean Water Fund")
+
+        self.assertEqual(self.statuses(), {"1001": "RENDERED", "1002": "RENDERED"})
+
+    def test_force_always_renders(self, write_artifact, *mocks):
+        self.record_reports()
+
+        self.assertEqual(
+            self.statuses(force=True), {"1001": "RENDERED", "1002": "RENDERED"}
+        )
+        self.assertIn("rendered", process_donor_report("1001", force=True))
+        self.assertEqual(write_artifact.call_count, 3)
+
+    def test_blank_legacy_fingerprint_never_matches(self, write_artifact, *mocks):
+        self.record_reports(legacy=True)
+
+        self.assertEqual(self.statuses(), {"1001": "RENDERED", "1002": "RENDERED"})
+        self.assertIn("rendered", process_donor_report("1001"))
+
+
+@mock.patch.object(process_donor_report_batch, "update_state")
+class ReportBatchCountersTests(TestCase):
+    def setUp(self):
+        rows = [
+            row
+            for number in range(1, 4)
+            for row in donation_rows(
+                **{"Donor ID": f"100{number}", "Donation ID": f"D{number}"}
+            )
+        ]
+        ingest_frames([pd.DataFrame(rows)])
+        self.donor_ids = ["1001", "1002", "1003"]
+        self.job = ImportJob.objects.create(file_name="donations.csv", reports_total=3)
+
+    def assert_counters(self, succeeded=0, skipped=0, failed=0):
+        self.job.refresh_from_db()
+        self.assertEqual(
+            (
+                self.job.reports_succeeded,
+                self.job.reports_skipped,
+                self.job.reports_failed,
+            ),
+            (succeeded, skipped, failed),
+        )
+
+    def test_error_before_rendering_counts_every_donor_as_failed(self, update_state):
+        with mock.patch(
+            "reports.tasks.report_fingerprints", side_effect=RuntimeError("db down")
+        ):
+            with self.assertRaises(RuntimeError):
+                process_donor_report_batch(self.donor_ids, job_id=self.job.pk)
+
+        self.assert_counters(failed=3)
+
+    def test_error_partway_counts_unprocessed_donors_as_failed(self, update_state):
+        with mock.patch(
+            "reports.tasks.write_report_artifact", return_value=("report.pdf", 10)
+        ), mock.patch(
+            "reports.tasks.upload_donor_report.delay",
+            side_effect=[mock.Mock(id="upload-1"), ConnectionError("broker down")],
+        ):
+            with self.assertRaises(ConnectionError):
+                process_donor_report_batch(self.donor_ids, job_id=self.job.pk)
+
+        # The first donor is left for its upload task to count
+        self.assert_counters(failed=2)
+
+
+class UploadDonorReportTests(TestCase):
+    def setUp(self):
+        ingest_frames([pd.DataFrame(donation_rows())])
+        self.job = ImportJob.objects.create(file_name="donations.csv", reports_total=1)
+        artifact = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+        with artifact:
+            artifact.write(b"%PDF-1.4")
+        self.artifact_path = artifact.name
+        self.addCleanup(
+            lambda: os.path.exists(self.artifact_path) and os.remove(self.artifact_path)
+        )
+
+    def upload(self):
+        # Runs eagerly; retries run in place before apply returns
+        return upload_donor_report.apply(
+            args=["1001", self.artifact_path, "fingerprint", 8, self.job.pk],
+            throw=False,
+        )
+
+    def test_transient_error_is_retried_with_the_artifact_kept(self):
+        with mock.patch(
+            "reports.tasks.upload_report",
+            side_effect=[ConnectionError("reset"), "charity_reports/1001.pdf"],
+        ) as upload_report:
+            self.upload()
+
+        self.assertEqual(upload_report.call_count, 2)
+        self.assertEqual(
+            list(Report.objects.values_list("status", "file_path")),
+            [("SUCCESS", "charity_reports/1001.pdf")],
+        )
+        self.assertFalse(os.path.exists(self.artifact_path))
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.reports_succeeded, self.job.reports_failed), (1, 0))
+
+    def test_artifact_is_removed_after_the_last_attempt(self):
+        with mock.patch(
+            "reports.tasks.upload_report", side_effect=ConnectionError("reset")
+        ) as upload_report:
+            result = self.upload()
+
+        self.assertTrue(result.failed())
+        self.assertEqual(upload_report.call_count, upload_donor_report.max_retries + 1)
+        self.assertEqual(
+            list(Report.objects.values_list("status", flat=True)), ["FAILED"]
+        )
+        self.assertFalse(os.path.exists(self.artifact_path))
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.reports_succeeded, self.job.reports_failed), (0, 1))
+
+
+class WarmUpWorkerTests(TestCase):
+    @mock.patch("reports.tasks.load_report_assets")
+    @mock.patch("reports.tasks.warm_up_charts")
+    def test_missing_optional_module_is_skipped(self, warm_up_charts, load_assets):
+        with mock.patch(
+            "reports.tasks.WARM_UP_MODULES", ["json", "google.not_installed"]
+        ):
+            warm_up_worker()
+
+        warm_up_charts.assert_called_once()
+        load_assets.assert_called_once()
+
+
+class IterReportDataTests(TestCase):
+    @override_settings(REPORT_TABLE_MAX_ROWS=2)
+    def test_rows_are_limited_per_donor(self):
+        days = {"1001": [3, 1, 2], "1002": [5], "1003": [9, 8]}
+        rows = [
+            {
+                **row,
+                "Donor ID": donor_id,
+                "Donation ID": f"{donor_id}-{day}",
+                "Date of Donation": f"2024-01-{day:02d}",
+            }
+            for donor_id, donor_days in days.items()
+            for day in donor_days
+            for row in donation_rows()
+        ]
+        ingest_frames([pd.DataFrame(rows)])
+
+        tables = {}
+        for donor_id, report_data in iter_report_data(["1001", "1002", "1003"]):
+            tables[donor_id] = [row[0] for row in report_data.rows]
+            expected = load_report_data(Donor.objects.get(donor_id=donor_id))
+            with self.subTest(donor_id=donor_id):
+                self.assertEqual(tables[donor_id], [row[0] for row in expected.rows])
+                self.assertEqual(report_data.donation_count, expected.donation_count)
+
+        self.assertEqual(
+            tables,
+            {
+                "1001": ["1001-1", "1001-2"],
+                "1002": ["1002-5"],
+                "1003": ["1003-8", "1003-9"],
+            },
+        )
+
+
+class DiskChartStoreTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_prunes_oldest_charts_only_past_the_limit(self):
+        store = DiskChartStore(self.directory, max_bytes=25)
+        with mock.patch.object(store, "_scan", wraps=store._scan) as scan:
+            store.set("first", b"1" * 10)
+            os.utime(store._path("first"), (0, 0))
+            store.set("second", b"2" * 10)
+            store.set("second", b"2" * 10)
+            self.assertEqual(scan.call_count, 0)
+
+            store.set("third", b"3" * 10)
+
+        self.assertEqual(scan.call_count, 1)
+        self.assertIsNone(store.get("first"))
+        self.assertEqual(store.get("third"), b"3" * 10)
+        self.assertEqual(store.total, 20)
+        self.assertEqual(
+            sorted(os.listdir(self.directory)), ["second.chart", "third.chart"]
+        )
+
+    def test_existing_charts_count_towards_the_limit(self):
+        DiskChartStore(self.directory, max_bytes=100).set("first", b"1" * 10)
+
+        store = DiskChartStore(self.directory, max_bytes=100)
+
+        self.assertEqual(store.total, 10)
+
+
+class ByteRangeTests(SimpleTestCase):
+    def test_ranges(self):
+        for header, expected in [
+            ("bytes=0-9", (0, 9)),
+            ("bytes=5-", (5, 99)),
+            ("bytes=90-200", (90, 99)),
+            ("bytes=-10", (90, 99)),
+            ("bytes=-200", (0, 99)),
+            ("bytes=5-2", None),
+            ("bytes=-", None),
+            ("bytes=0-1,5-6", None),
+            ("items=0-9", None),
+        ]:
+            with self.subTest(header=header):
+                self.assertEqual(byte_range(header, 100), expected)
+
+    def test_unsatisfiable_ranges(self):
+        for header in ["bytes=100-", "bytes=150-200"]:
+            with self.subTest(header=header):
+                with self.assertRaises(ValueError):
+                    byte_range(header, 100)
+
+
+class StorageFileResponseTests(SimpleTestCase):
+    etag = '"report-1"'
+    last_modified = datetime(2024, 1, 15, 12, 0, tzinfo=timezone.utc)
+
+    def setUp(self):
+        self.storage = InMemoryStorage()
+        self.storage.files["charity_reports/1001.pdf"] = bytes(range(100))
+        patcher = mock.patch("reports.views.get_storage", return_value=self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def respond(self, key="charity_reports/1001.pdf", **headers):
+        request = RequestFactory().get("/", headers=headers)
+        return storage_file_response(
+            request, key, "1001.pdf", self.etag, self.last_modified
+        )
+
+    def test_full_file(self):
+        response = self.respond()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), bytes(range(100)))
+        self.assertEqual(response["Content-Length"], "100")
+        self.assertEqual(response["ETag"], self.etag)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+
+    def test_missing_file(self):
+        self.assertEqual(self.respond(key="charity_reports/none.pdf").status_code, 404)
+
+    def test_not_modified(self):
+        for headers in [
+            {"If-None-Match": self.etag},
+            {"If-Modified-Since": "Mon, 15 Jan 2024 12:00:00 GMT"},
+        ]:
+            with self.subTest(headers=headers):
+                response = self.respond(**headers)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response["ETag"], self.etag)
+
+    def test_partial_content(self):
+        response = self.respond(Range="bytes=10-19")
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), bytes(range(10, 20)))
+        self.assertEqual(response["Content-Range"], "bytes 10-19/100")
+        self.assertEqual(response["Content-Length"], "10")
+
+    def test_malformed_range_sends_the_whole_file(self):
+        response = self.respond(Range="bytes=5-2")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Length"], "100")
+
+    def test_unsatisfiable_range(self):
+        response = self.respond(Range="bytes=100-")
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */100")
+
+    def test_if_range(self):
+        matching = self.respond(Range="bytes=0-9", **{"If-Range": self.etag})
+        stale = self.respond(Range="bytes=0-9", **{"If-Range": '"report-0"'})
+
+        self.assertEqual(matching.status_code, 206)
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(b"".join(stale.streaming_content), bytes(range(100)))
+
+
+class UrlToKeyTests(SimpleTestCase):
+    key = "charity_reports/1001_ada_lovelace_report.pdf"
+
+    def setUp(self):
+        self.url_to_key = importlib.import_module(
+            "reports.migrations.0010_report_file_path_keys"
+        ).url_to_key
+
+    def test_gcs_signed_urls(self):
+        query = "?X-Goog-Algorithm=GOOG4-RSA-SHA256&X-Goog-Signature=abc123"
+        for url in [
+            f"https://storage.googleapis.com/test-bucket/{self.key}{query}",
+            f"https://test-bucket.storage.googleapis.com/{self.key}{query}",
+        ]:
+            with self.subTest(url=url):
+                self.assertEqual(self.url_to_key(url), self.key)
+
+    def test_percent_encoded_key(self):
+        url = "https://storage.googleapis.com/test-bucket/charity_reports/a%20b.pdf"
+
+        self.assertEqual(self.url_to_key(url), "charity_reports/a b.pdf")
+
+    def test_keys_are_unchanged(self):
+        self.assertEqual(self.url_to_key(self.key), self.key)
+
+    def test_local_token_url(self):
+        self.assertEqual(self.url_to_key(signed_file_url(self.key, 3600)), self.key)
+
+    def test_tampered_token_url_is_unchanged(self):
+        url = signed_file_url(self.key, 3600).rstrip("/") + "x/"
+
+        self.assertEqual(self.url_to_key(url), url)
@@ -4,13 +4,21 @@ from .views import (
     FetchReportView,
     DonorReportsListView,
     ReportStatusView,
+    ImportJobStatusView,
+    ReportFileView,
 )
 
 urlpatterns = [
     path("upload/", FileUploadView.as_view(), name="file-upload"),
-    path("get-report/", FetchReportView.as_view(), name="get-report"),
+    path(
+        "get-report/<str:donor_id>/", FetchReportView.as_view(), name="get-report"
+    ),
     path(
         "donor-reports-list/", DonorReportsListView.as_view(), name="donor-reports-list"
     ),
     path("status/<str:task_id>/", ReportStatusView.as_view(), name="report-status"),
+    path("files/<str:token>/", ReportFileView.as_view(), name="report-file"),
+    path(
+        "imports/<int:job_id>/", ImportJobStatusView.as_view(), name="import-status"
+    ),
 ]
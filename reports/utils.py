@@ -6,29 +6,114 @@ from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib import utils
 from reportlab.lib.utils import ImageReader
 from io import BytesIO
-import matplotlib
-
-
-
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
-
-
-def generate_donation_pie_chart(donations):
-
-    #
-    cause_totals = {}
-    for donation in donations:
-        cause_totals[donation.cause.name] = (
-            cause_totals.get(donation.cause.name, 0) + donation.amount
-        )
-
-    causes = list(cause_totals.keys())
-    amounts = list(cause_totals.values())
-
-    fig, ax = plt.subplots()
+import functools
+import logging
+import tempfile
+import threading
+from itertools import islice
+from django.conf import settings
+from matplotlib import font_manager
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from .chart_cache import chart_key, get_chart_cache
+from .vector_charts import draw_donation_bar_chart, draw_donation_pie_chart
+
+# Set up a logger for this module
+logger = logging.getLogger(__name__)
+
+PRIMARY_COLOR = colors.HexColor("#3498db")
+SECONDARY_COLOR = colors.HexColor("#2ecc71")
+
+# Chart appearance, part of every chart's cache key
+CHART_STYLE = {
+    "bar_color": "skyblue",
+    "pie_startangle": 90,
+}
+
+
+# Bump whenever the report layout changes so unchanged donors are re-rendered
+REPORT_TEMPLATE_VERSION = 1
+
+
+def report_template_key():
+    """Everything besides the donor's own data that shapes the rendered PDF."""
+    return [
+        REPORT_TEMPLATE_VERSION,
+        settings.REPORT_CHART_BACKEND,
+        settings.REPORT_COMPACT_TABLE_ROWS,
+        settings.REPORT_TABLE_MAX_ROWS,
+        settings.REPORT_MAX_CHART_BARS,
+        chart_style(),
+        output_profile()["page_compression"],
+    ]
+
+
+def output_profile():
+    """The REPORT_OUTPUT_PROFILES entry selected by REPORT_OUTPUT_PROFILE."""
+    return settings.REPORT_OUTPUT_PROFILES[settings.REPORT_OUTPUT_PROFILE]
+
+
+def chart_style():
+    """CHART_STYLE plus the image settings of the current output profile."""
+    profile = output_profile()
+    return {
+        **CHART_STYLE,
+        "format": profile["chart_format"],
+        "dpi": profile["chart_dpi"],
+        "quality": profile.get("chart_quality"),
+    }
+
+
+_warm_up_lock = threading.Lock()
+_warmed_up = False
+
+
+def new_figure():
+    # Figures are built without pyplot so nothing touches its global figure
+    # manager, which keeps rendering safe across threads and leak-free on errors
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot()
+
+
+def save_figure(fig):
+    style = chart_style()
+    options = {}
+    if style["quality"]:
+        options["pil_kwargs"] = {"quality": style["quality"]}
+    chart_buffer = BytesIO()
+    fig.savefig(
+        chart_buffer,
+        format=style["format"],
+        dpi=style["dpi"],
+        bbox_inches="tight",
+        **options,
+    )
+    return chart_buffer.getvalue()
+
+
+def warm_up_charts():
+    """
+    Load matplotlib's fonts and render throwaway charts once per process, so
+    the first real report does not pay for font lookup and text layout.
+    """
+    global _warmed_up
+    with _warm_up_lock:
+        if _warmed_up:
+            return
+        font_manager.findfont(font_manager.FontProperties())
+        render_donation_pie_chart(["Warm up"], [1.0])
+        render_donation_bar_chart(["2024-01-01"], [1.0])
+        _warmed_up = True
+
+
+def render_donation_pie_chart(causes, amounts):
+    fig, ax = new_figure()
     wedges, texts, autotexts = ax.pie(
-        amounts, labels=causes, autopct="%1.1f%%", startangle=90
+        amounts,
+        labels=causes,
+        autopct="%1.1f%%",
+        startangle=CHART_STYLE["pie_startangle"],
     )
     ax.axis("equal")
 
@@ -36,37 +121,57 @@ def generate_donation_pie_chart(donations):
         wedges, causes, title="Causes", loc="center left", bbox_to_anchor=(1, 0, 0.5, 1)
     )
 
-    chart_buffer = BytesIO()
-    plt.savefig(chart_buffer, format="PNG", bbox_inches="tight")
-    chart_buffer.seek(0)
-    plt.close(fig)
+    return save_figure(fig)
 
-    return chart_buffer
 
+def pie_chart_data(report_data):
+    causes = [name or "Unspecified" for name in report_data.cause_totals]
+    amounts = [float(amount) for amount in report_data.cause_totals.values()]
+    return causes, amounts
 
-def generate_donation_bar_chart(donations):
 
-    donations = sorted(donations, key=lambda d: d.date)
+def generate_donation_pie_chart(report_data):
+    causes, amounts = pie_chart_data(report_data)
 
-    dates = [donation.date.strftime("%Y-%m-%d") for donation in donations]
-    amounts = [donation.amount for donation in donations]
+    # Donors with the same totals per cause share one rendered chart
+    key = chart_key("pie", [causes, amounts], chart_style())
+    chart = get_chart_cache().get_or_render(
+        key, lambda: render_donation_pie_chart(causes, amounts)
+    )
+    return BytesIO(chart)
 
-    fig, ax = plt.subplots()
-    ax.bar(dates, amounts, color="skyblue", label="Donation Amount")
+
+def render_donation_bar_chart(dates, amounts):
+    fig, ax = new_figure()
+    ax.bar(dates, amounts, color=CHART_STYLE["bar_color"], label="Donation Amount")
 
     ax.set_xlabel("Date of Donation")
     ax.set_ylabel("Donation Amount")
     ax.set_title("Donations Over Time")
-    plt.xticks(rotation=45, ha="right")
+    ax.tick_params(axis="x", labelrotation=45)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment("right")
 
     ax.legend(loc="upper left")
 
-    chart_buffer = BytesIO()
-    plt.savefig(chart_buffer, format="PNG", bbox_inches="tight")
-    chart_buffer.seek(0)
-    plt.close(fig)
+    return save_figure(fig)
+
+
+def bar_chart_data(report_data):
+    series = report_data.date_series(settings.REPORT_MAX_CHART_BARS)
+    dates = [label for label, _ in series]
+    amounts = [float(amount) for _, amount in series]
+    return dates, amounts
+
+
+def generate_donation_bar_chart(report_data):
+    dates, amounts = bar_chart_data(report_data)
 
-    return chart_buffer
+    key = chart_key("bar", [dates, amounts], chart_style())
+    chart = get_chart_cache().get_or_render(
+        key, lambda: render_donation_bar_chart(dates, amounts)
+    )
+    return BytesIO(chart)
 
 
 def get_image(path, width=1 * inch, height=1 * inch):
@@ -76,26 +181,40 @@ def get_image(path, width=1 * inch, height=1 * inch):
     return img, width, width * aspect
 
 
-def generate_donor_report(donor, donations):
+@functools.lru_cache(maxsize=None)
+def get_logo():
+    """Decode the report logo once per process; None when it is not configured."""
+    logo_path = settings.REPORT_LOGO_PATH
+    if not logo_path:
+        return None
+    try:
+        img, img_width, img_height = get_image(logo_path, width=2 * inch)
+        # Decode the pixels now rather than on the first report
+        img.getRGBData()
+        return img, img_width, img_height
+    except OSError as e:
+        logger.warning(f"Report logo could not be loaded from {logo_path}: {e}")
+        return None
+
+
+def load_report_assets():
+    """Load the images every report uses, ahead of the first task."""
+    get_logo()
 
-    buffer = BytesIO()
-    pdf = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-    pdf.setTitle("Charity Impact Report")
 
-    primary_color = colors.HexColor("#3498db")
-    secondary_color = colors.HexColor("#2ecc71")
+def draw_cover_header(pdf):
+    width, height = A4
 
-    pdf.setFillColor(primary_color)
+    pdf.setFillColor(PRIMARY_COLOR)
     pdf.rect(0, height - 120, width, 120, fill=True, stroke=False)
 
     pdf.setFont("Helvetica-Bold", 36)
     pdf.setFillColor(colors.white)
     pdf.drawCentredString(width / 2, height - 80, "Charity Impact Report")
 
-    try:
-        img_path = "path_to_logo.png"
-        img, img_width, img_height = get_image(img_path, width=2 * inch)
+    logo = get_logo()
+    if logo:
+        img, img_width, img_height = logo
         pdf.drawImage(
             img,
             width - img_width - 50,
@@ -104,8 +223,56 @@ def generate_donor_report(donor, donations):
             height=img_height,
             mask="auto",
         )
-    except:
-        print("Logo not found")
+
+
+def draw_table_header(pdf):
+    width, height = A4
+
+    pdf.setFont("Helvetica-Bold", 18)
+    pdf.drawCentredString(width / 2, height - 100, "Donation Summary")
+
+    y_position = height - 140
+
+    pdf.setFont("Helvetica-Bold", 12)
+    pdf.setFillColor(PRIMARY_COLOR)
+    pdf.drawString(100, y_position, "Donation ID")
+    pdf.drawString(250, y_position, "Cause")
+    pdf.drawString(400, y_position, "Amount")
+    pdf.drawString(500, y_position, "Date")
+
+
+def draw_thank_you_page(pdf):
+    width, height = A4
+
+    pdf.setFont("Helvetica-Bold", 24)
+    pdf.setFillColor(SECONDARY_COLOR)
+    pdf.drawCentredString(width / 2, height - 100, "Thank You!")
+
+    pdf.setFont("Helvetica", 14)
+    pdf.setFillColor(colors.black)
+    pdf.drawCentredString(
+        width / 2, height - 140, "We appreciate your continued support."
+    )
+    pdf.drawCentredString(
+        width / 2, height - 160, "Together, we can achieve great things."
+    )
+
+
+def generate_donor_report(donor, report_data, output=None):
+    """
+    Render a donor's report into output, by default a temporary file that
+    stays in memory up to REPORT_SPOOL_MAX_SIZE and spills to disk beyond
+    it. The file is returned rewound; the caller should close it.
+    """
+    if output is None:
+        output = tempfile.SpooledTemporaryFile(max_size=settings.REPORT_SPOOL_MAX_SIZE)
+    pdf = canvas.Canvas(
+        output, pagesize=A4, pageCompression=output_profile()["page_compression"]
+    )
+    width, height = A4
+    pdf.setTitle("Charity Impact Report")
+
+    draw_cover_header(pdf)
 
     pdf.setFont("Helvetica", 14)
     pdf.setFillColor(colors.black)
@@ -125,79 +292,94 @@ def generate_donor_report(donor, donations):
 
     pdf.showPage()
 
-    pdf.setFont("Helvetica-Bold", 18)
-    pdf.drawCentredString(width / 2, height - 100, "Donation Summary")
-
-    y_position = height - 140
-
-    pdf.setFont("Helvetica-Bold", 12)
-    pdf.setFillColor(primary_color)
-    pdf.drawString(100, y_position, "Donation ID")
-    pdf.drawString(250, y_position, "Cause")
-    pdf.drawString(400, y_position, "Amount")
-    pdf.drawString(500, y_position, "Date")
+    draw_table_header(pdf)
 
-    y_position -= 20
+    y_position = height - 160
     pdf.setFillColor(colors.black)
 
-    for donation in donations:
-        pdf.setFont("Helvetica", 12)
-        pdf.drawString(100, y_position, donation.donation_id)
-        pdf.drawString(250, y_position, donation.cause.name)
-        pdf.drawString(400, y_position, f"${donation.amount:.2f}")
-        pdf.drawString(500, y_position, donation.date.strftime("%Y-%m-%d"))
-
-        y_position -= 40
+    # Long histories switch to tighter rows and stop after REPORT_TABLE_MAX_ROWS
+    if report_data.donation_count > settings.REPORT_COMPACT_TABLE_ROWS:
+        font_size, row_step = 9, 14
+    else:
+        font_size, row_step = 12, 40
+
+    shown_count = 0
+    shown_amount = 0
+    for donation_id, cause_name, amount, date in islice(
+        report_data.rows, settings.REPORT_TABLE_MAX_ROWS
+    ):
+        pdf.setFont("Helvetica", font_size)
+        pdf.drawString(100, y_position, donation_id)
+        pdf.drawString(250, y_position, cause_name or "Unspecified")
+        pdf.drawString(400, y_position, f"${amount:.2f}")
+        pdf.drawString(500, y_position, date.strftime("%Y-%m-%d"))
+        shown_count += 1
+        shown_amount += amount
+
+        y_position -= row_step
 
         if y_position < 100:
             pdf.showPage()
             y_position = height - 100
 
+    remaining = report_data.donation_count - shown_count
+    if remaining > 0:
+        pdf.setFont("Helvetica-Oblique", font_size)
+        pdf.drawString(
+            100,
+            y_position,
+            f"... and {remaining} more donations totalling "
+            f"${report_data.total_amount - shown_amount:.2f}",
+        )
+
     pdf.showPage()
 
     pdf.setFont("Helvetica-Bold", 18)
     pdf.drawCentredString(width / 2, height - 100, "Donation Summary and Trends")
 
-    pie_chart = generate_donation_pie_chart(donations)
-
-    bar_chart = generate_donation_bar_chart(donations)
-
     chart_width = width - 100
     chart_height = 250
 
     pie_x = 50
     pie_y = height - 370
 
-    pdf.drawImage(
-        ImageReader(pie_chart), pie_x, pie_y, width=chart_width, height=chart_height
-    )
-
     bar_x = 50
     bar_y = pie_y - chart_height - 70
 
-    pdf.drawImage(
-        ImageReader(bar_chart),
-        bar_x,
-        bar_y,
-        width=chart_width,
-        height=chart_height + 50,
-    )
+    if settings.REPORT_CHART_BACKEND == "reportlab":
+        # Vector charts drawn straight onto the page, no PNG round trip
+        draw_donation_pie_chart(
+            pdf, *pie_chart_data(report_data), pie_x, pie_y, chart_width, chart_height
+        )
+        draw_donation_bar_chart(
+            pdf,
+            *bar_chart_data(report_data),
+            bar_x,
+            bar_y,
+            chart_width,
+            chart_height + 50,
+        )
+    else:
+        pie_chart = generate_donation_pie_chart(report_data)
 
-    pdf.showPage()
+        bar_chart = generate_donation_bar_chart(report_data)
 
-    pdf.setFont("Helvetica-Bold", 24)
-    pdf.setFillColor(secondary_color)
-    pdf.drawCentredString(width / 2, height - 100, "Thank You!")
+        pdf.drawImage(
+            ImageReader(pie_chart), pie_x, pie_y, width=chart_width, height=chart_height
+        )
 
-    pdf.setFont("Helvetica", 14)
-    pdf.setFillColor(colors.black)
-    pdf.drawCentredString(
-        width / 2, height - 140, "We appreciate your continued support."
-    )
-    pdf.drawCentredString(
-        width / 2, height - 160, "Together, we can achieve great things."
-    )
+        pdf.drawImage(
+            ImageReader(bar_chart),
+            bar_x,
+            bar_y,
+            width=chart_width,
+            height=chart_height + 50,
+        )
+
+    pdf.showPage()
+
+    draw_thank_you_page(pdf)
 
     pdf.save()
-    buffer.seek(0)
-    return buffer
+    output.seek(0)
+    return output
@@ -0,0 +1,117 @@
+from reportlab.graphics import renderPDF
+from reportlab.graphics.charts.barcharts import VerticalBarChart
+from reportlab.graphics.charts.legends import Legend
+from reportlab.graphics.charts.piecharts import Pie
+from reportlab.graphics.shapes import Drawing, Group, String
+from reportlab.lib import colors
+
+# Matplotlib's default colour cycle, so both backends look alike
+PIE_COLORS = [
+    colors.HexColor(hex_color)
+    for hex_color in [
+        "#1f77b4",
+        "#ff7f0e",
+        "#2ca02c",
+        "#d62728",
+        "#9467bd",
+        "#8c564b",
+        "#e377c2",
+        "#7f7f7f",
+        "#bcbd22",
+        "#17becf",
+    ]
+]
+BAR_COLOR = colors.HexColor("#87ceeb")
+
+
+def draw_donation_pie_chart(pdf, causes, amounts, x, y, width, height):
+    """Draw the donations-by-cause pie chart as vector graphics on the canvas."""
+    drawing = Drawing(width, height)
+    total = sum(amounts) or 1
+
+    pie = Pie()
+    size = min(width / 2, height) - 20
+    pie.x = (width / 2 - size) / 2
+    pie.y = (height - size) / 2
+    pie.width = pie.height = size
+    pie.data = amounts
+    pie.labels = [f"{amount / total:.1%}" for amount in amounts]
+    pie.startAngle = 90
+    pie.direction = "anticlockwise"
+    pie.slices.strokeColor = colors.white
+    pie.slices.fontName = "Helvetica"
+    pie.slices.fontSize = 9
+    pie.slices.labelRadius = 0.65
+    for index in range(len(amounts)):
+        pie.slices[index].fillColor = PIE_COLORS[index % len(PIE_COLORS)]
+    drawing.add(pie)
+
+    legend = Legend()
+    legend.x = width / 2 + 10
+    legend.y = height / 2 + 10 * len(causes)
+    legend.fontName = "Helvetica"
+    legend.fontSize = 9
+    legend.alignment = "right"
+    legend.columnMaximum = max(len(causes), 1)
+    legend.colorNamePairs = [
+        (PIE_COLORS[index % len(PIE_COLORS)], cause)
+        for index, cause in enumerate(causes)
+    ]
+    drawing.add(String(legend.x, legend.y + 12, "Causes", fontName="Helvetica-Bold"))
+    drawing.add(legend)
+
+    renderPDF.draw(drawing, pdf, x, y)
+
+
+def draw_donation_bar_chart(pdf, dates, amounts, x, y, width, height):
+    """Draw the donations-over-time bar chart as vector graphics on the canvas."""
+    drawing = Drawing(width, height)
+
+    chart = VerticalBarChart()
+    chart.x = 50
+    chart.y = 70
+    chart.width = width - 70
+    chart.height = height - 100
+    chart.data = [amounts or [0]]
+    chart.bars[0].fillColor = BAR_COLOR
+    chart.bars[0].strokeColor = None
+    chart.valueAxis.valueMin = 0
+    chart.valueAxis.labels.fontName = "Helvetica"
+    chart.valueAxis.labels.fontSize = 8
+    chart.categoryAxis.categoryNames = dates
+    chart.categoryAxis.labels.fontName = "Helvetica"
+    chart.categoryAxis.labels.fontSize = 8
+    chart.categoryAxis.labels.angle = 45
+    chart.categoryAxis.labels.boxAnchor = "ne"
+    drawing.add(chart)
+
+    drawing.add(
+        String(
+            width / 2,
+            height - 15,
+            "Donations Over Time",
+            fontName="Helvetica-Bold",
+            fontSize=12,
+            textAnchor="middle",
+        )
+    )
+    drawing.add(
+        String(
+            width / 2,
+            5,
+            "Date of Donation",
+            fontName="Helvetica",
+            fontSize=9,
+            textAnchor="middle",
+        )
+    )
+    y_label = Group(
+        String(
+            0, 0, "Donation Amount", fontName="Helvetica", fontSize=9, textAnchor="middle"
+        )
+    )
+    y_label.translate(12, height / 2)
+    y_label.rotate(90)
+    drawing.add(y_label)
+
+    renderPDF.draw(drawing, pdf, x, y)
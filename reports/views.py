@@ -1,44 +1,38 @@
-from datetime import datetime
+import logging
+import mimetypes
+import os
+import re
+import uuid
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework import status
-import pandas as pd
-from storages.backends.gcloud import GoogleCloudStorage
-from donations.models import Donor, Donation
-from reports.models import Cause, Report
-import chardet
-from .tasks import process_donor_report
-from collections import defaultdict
-from django.http import HttpResponse
+from donations.models import Donor
+from reports.models import ImportJob, Report
+from .ingestion import file_digest, spool_upload
+from .signed_urls import signed_urls
+from .storage import get_storage, key_from_token
+from .tasks import process_import_job
+from django.conf import settings
+from django.core import signing
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils import timezone
+from django.utils.http import http_date
 from rest_framework.pagination import PageNumberPagination
 from celery.result import AsyncResult
 
+# Set up a logger for this module
+logger = logging.getLogger(__name__)
 
-from datetime import datetime
-from rest_framework.views import APIView
-from rest_framework.response import Response
-from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework import status
-import pandas as pd
-from storages.backends.gcloud import GoogleCloudStorage
-from donations.models import Donor, Donation
-from reports.models import Cause, Report
-import chardet
-from .tasks import process_donor_report
-from collections import defaultdict
-from django.http import HttpResponse
-from rest_framework.pagination import PageNumberPagination
-from celery.result import AsyncResult
+# A single "bytes=first-last" range; multiple ranges are not supported
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
 
 
 class FileUploadView(APIView):
     parser_classes = (MultiPartParser, FormParser)
 
     def post(self, request, *args, **kwargs):
-        # Create an instance of GoogleCloudStorage
-        google_storage = GoogleCloudStorage()
-
         file = request.FILES.get("file")
 
         # Validate if the file exists
@@ -55,158 +49,140 @@ class FileUploadView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # Save the uploaded file using GoogleCloudStorage
-        file_path = google_storage.save(f"temp/{file.name}", file)
-
-        try:
-            # Open the file using GoogleCloudStorage
-            with google_storage.open(file_path, "rb") as raw_file:
-                # Detect file encoding using chardet
-                raw_data = raw_file.read()
-                result = chardet.detect(raw_data)
-                encoding = result["encoding"]
-                raw_file.seek(0)  # Reset the file pointer to the beginning
-
-                # Process CSV or Excel files using the detected encoding
-                if file_extension == "csv":
-                    df = pd.read_csv(raw_file, encoding=encoding)
-                else:
-                    df = pd.read_excel(raw_file)
-
-            # Required columns
-            required_columns = [
-                "Donor ID",
-                "Donation ID",
-                "Donor First Name",
-                "Donor Last Name",
-                "Donor Email",
-                "Donation Amount",
-                "Date of Donation",
-                "Time of Donation",
-                "Cause ID",
-                "Cause",
-            ]
-            if not all(column in df.columns for column in required_columns):
-                return Response(
-                    {
-                        "error": f"Missing required columns. Expected: {required_columns}"
-                    },
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-            # Collect donations per donor
-            donations_per_donor = defaultdict(list)
-
-            for _, row in df.iterrows():
-                # Create or get the donor object
-                donor, _ = Donor.objects.get_or_create(
-                    donor_id=row["Donor ID"],
-                    defaults={
-                        "first_name": row["Donor First Name"],
-                        "last_name": row["Donor Last Name"],
-                        "email": row["Donor Email"],
-                        "phone": row.get("Phone Number", None),
-                        "address": row.get("Address", None),
-                    },
-                )
-
-                # Create or get the cause object
-                cause, _ = Cause.objects.get_or_create(
-                    cause_id=row["Cause ID"],
-                    defaults={
-                        "name": row["Cause"],
-                        "description": row.get("Description", ""),
-                        "images": row.get("Images", None),
-                    },
-                )
-
-                # Parse the date and time of donation
-                try:
-                    donation_date = datetime.strptime(
-                        row["Date of Donation"], "%Y-%m-%d"
-                    ).date()
-                    donation_time = datetime.strptime(
-                        row["Time of Donation"], "%I:%M %p"
-                    ).time()
-                except ValueError as ve:
-                    return Response(
-                        {
-                            "error": f"Invalid date or time format in row: {row}. Error: {str(ve)}"
-                        },
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-
-                # Create the donation entry
-                donation = Donation.objects.create(
-                    donor=donor,
-                    donation_id=row["Donation ID"],
-                    amount=row["Donation Amount"],
-                    date=donation_date,
-                    time=donation_time,
-                    cause=cause,
-                    payment_type=row.get("Payment Type", None),
-                    recurrence=row.get("Recurrence Status", None),
-                    tax_receipt_status=row.get("Tax Receipt Status", False),
-                )
-
-                # Add the donation to the donor's list
-                donations_per_donor[donor.donor_id].append(donation)
+        # An identical file that was already imported has nothing left to do
+        content_hash = file_digest(file)
+        previous_job = (
+            ImportJob.objects.filter(content_hash=content_hash)
+            .exclude(status="FAILED")
+            .order_by("-date_created")
+            .first()
+        )
+        if previous_job:
+            return Response(
+                {
+                    "message": "This file has already been uploaded.",
+                    "job_id": previous_job.pk,
+                },
+                status=status.HTTP_200_OK,
+            )
 
-            # Trigger report generation for each unique donor and collect task IDs
-            task_ids = []
-            for donor_id in donations_per_donor.keys():
-                task = process_donor_report.delay(donor_id)
-                task_ids.append(task.id)
+        # Keep the upload on local disk for the import worker
+        file_path = spool_upload(file)
 
+        # Parse and import the file in the background
+        job = ImportJob.objects.create(
+            file_name=file.name,
+            file_path=file_path,
+            content_hash=content_hash,
+            task_id=str(uuid.uuid4()),
+        )
+        try:
+            process_import_job.apply_async((job.pk,), task_id=job.task_id)
         except Exception as e:
+            # A job that was never queued must not block re-uploading the file
+            logger.error(f"Failed to queue import job {job.pk}: {e}")
+            ImportJob.objects.filter(pk=job.pk).update(
+                status="FAILED", error_log=str(e), date_finished=timezone.now()
+            )
+            os.remove(file_path)
             return Response(
-                {"error": f"Error processing file: {str(e)}"},
-                status=status.HTTP_400_BAD_REQUEST,
+                {"error": "The import could not be started. Please try again."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
             )
-        finally:
-            # Delete the uploaded file from Google Cloud Storage
-            google_storage.delete(file_path)
 
-        # Return the list of task IDs
         return Response(
             {
-                "message": "File uploaded and processed successfully!",
-                "task_ids": task_ids,
+                "message": "File uploaded successfully! Import in progress.",
+                "job_id": job.pk,
             },
             status=status.HTTP_202_ACCEPTED,
         )
 
 
-class FetchReportView(APIView):
-    def get(self, request, donor_id, *args, **kwargs):
-        # Create an instance of GoogleCloudStorage
-        google_storage = GoogleCloudStorage()
+class ImportJobStatusView(APIView):
+    def get(self, request, job_id):
+        try:
+            job = ImportJob.objects.get(pk=job_id)
+        except ImportJob.DoesNotExist:
+            return Response({"error": "Import job not found."}, status=404)
 
         try:
-            # Find the latest successful report for the donor
-            report = Report.objects.filter(
-                donor__donor_id=donor_id, status="SUCCESS"
-            ).latest("date_generated")
-
-            # Check if the report file exists in Google Cloud Storage
-            if google_storage.exists(report.file_path):
-                # Open the file using Google Cloud Storage
-                with google_storage.open(report.file_path, "rb") as f:
-                    response = HttpResponse(f.read(), content_type="application/pdf")
-                    response["Content-Disposition"] = (
-                        f'inline; filename="{report.donor.first_name}_{report.donor.last_name}_report.pdf"'
-                    )
-                    return response
+            # Finished jobs are answered from the database, running ones from Celery
+            if job.status == "SUCCESS":
+                response = {"status": "SUCCESS", "progress": 100}
+            elif job.status == "FAILED":
+                response = {"status": "FAILED", "progress": 100, "error": job.error_log}
             else:
-                return HttpResponse(
-                    "Report file not found in Google Cloud Storage.", status=404
-                )
+                response = task_status(job.task_id)
+            response.update(
+                {
+                    "job_id": job.pk,
+                    "file_name": job.file_name,
+                    "rows_processed": job.rows_processed,
+                    "rows_inserted": job.rows_inserted,
+                    "rows_updated": job.rows_updated,
+                    "rows_unchanged": job.rows_unchanged,
+                    "rows_failed": job.rows_failed,
+                    "errors": job.errors,
+                    "report_group_id": job.report_group_id,
+                    "reports_total": job.reports_total,
+                    "reports_succeeded": job.reports_succeeded,
+                    "reports_skipped": job.reports_skipped,
+                    "reports_failed": job.reports_failed,
+                }
+            )
+            return Response(response)
 
+        except Exception as e:
+            return Response(
+                {"error": f"Error fetching import status: {str(e)}"}, status=500
+            )
+
+
+class FetchReportView(APIView):
+    def get(self, request, donor_id, *args, **kwargs):
+        try:
+            # Find the latest successful report for the donor
+            report = (
+                Report.objects.select_related("donor")
+                .filter(donor__donor_id=donor_id, status="SUCCESS")
+                .latest("date_generated")
+            )
         except Report.DoesNotExist:
             return HttpResponse(
                 "No successful report found for this donor.", status=404
             )
 
+        key = report.file_path
+        if settings.REPORT_DOWNLOAD_REDIRECT:
+            # Let the client download straight from storage
+            return HttpResponseRedirect(
+                get_storage().sign_url(key, settings.REPORT_REDIRECT_URL_EXPIRY)
+            )
+
+        return storage_file_response(
+            request,
+            key,
+            f"{report.donor.first_name}_{report.donor.last_name}_report.pdf",
+            etag=f'"report-{report.pk}"',
+            last_modified=report.date_generated,
+        )
+
+
+class ReportFileView(APIView):
+    # Serves files from the local and in-memory storage backends; the signed
+    # token in the URL is the credential, like a GCS signed URL
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request, token, *args, **kwargs):
+        try:
+            key = key_from_token(token)
+        except signing.BadSignature:
+            return HttpResponse("Invalid or expired file link.", status=403)
+
+        return storage_file_response(request, key, key.rsplit("/", 1)[-1])
+
 
 class DonorReportsListView(APIView):
     def get(self, request):
@@ -237,8 +213,9 @@ class DonorReportsListView(APIView):
                             "donor_id": donor.donor_id,
                             "full_name": f"{donor.first_name} {donor.last_name}",
                             "email": donor.email,
-                            "report_url": latest_report.file_path,
+                            "report_key": latest_report.file_path,
                             "status": latest_report.status,
+                            "file_size": latest_report.file_size,
                         }
                     )
 
@@ -247,6 +224,13 @@ class DonorReportsListView(APIView):
             paginator.page_size = 10  # Number of reports per page
             paginated_reports = paginator.paginate_queryset(donor_reports, request)
 
+            # Sign the whole page at once, mostly from the signed URL cache
+            urls = signed_urls(
+                [donor_report["report_key"] for donor_report in paginated_reports]
+            )
+            for donor_report in paginated_reports:
+                donor_report["report_url"] = urls[donor_report.pop("report_key")]
+
             return paginator.get_paginated_response(paginated_reports)
 
         except Exception as e:
@@ -255,36 +239,120 @@ class DonorReportsListView(APIView):
             )
 
 
+def byte_range(range_header, size):
+    """
+    Return the inclusive (start, end) byte range a Range header asks for, or
+    None to send the whole file, as for headers that are not a valid single
+    range. Raises ValueError when it cannot be satisfied.
+    """
+    match = RANGE_PATTERN.match(range_header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+
+    first, last = match.groups()
+    if first and last and int(last) < int(first):
+        # "bytes=5-2" is malformed rather than unsatisfiable
+        return None
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # "bytes=-N" asks for the last N bytes
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start > end:
+        raise ValueError(f"Unsatisfiable range: {range_header}")
+    return start, end
+
+
+def storage_file_response(request, key, file_name, etag=None, last_modified=None):
+    """
+    Stream a stored file in chunks, answering conditional requests with 304
+    and single-range requests with 206.
+    """
+    last_modified_timestamp = None
+    if last_modified:
+        last_modified_timestamp = int(last_modified.timestamp())
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=last_modified_timestamp
+    )
+    if not_modified is not None:
+        if etag:
+            not_modified["ETag"] = etag
+        return not_modified
+
+    storage = get_storage()
+    try:
+        size = storage.size(key)
+    except FileNotFoundError:
+        return HttpResponse("Report file not found in storage.", status=404)
+
+    start, length, status_code = 0, size, 200
+    range_header = request.headers.get("Range")
+    # With If-Range, the range only applies while the file is unchanged
+    if range_header and request.headers.get("If-Range", etag) == etag:
+        try:
+            requested = byte_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+        if requested:
+            start, end = requested
+            length = end - start + 1
+            status_code = 206
+
+    content_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+    response = StreamingHttpResponse(
+        storage.stream(key, start, length),
+        status=status_code,
+        content_type=content_type,
+    )
+    response["Content-Length"] = length
+    response["Accept-Ranges"] = "bytes"
+    if status_code == 206:
+        response["Content-Range"] = f"bytes {start}-{start + length - 1}/{size}"
+    response["Content-Disposition"] = f'inline; filename="{file_name}"'
+    if etag:
+        response["ETag"] = etag
+        # Browsers revalidate with If-None-Match instead of reusing stale copies
+        response["Cache-Control"] = "private, no-cache"
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified_timestamp)
+    return response
+
+
+def task_status(task_id):
+    # Get the task result using the provided task_id
+    task_result = AsyncResult(task_id)
+
+    # Determine the task status
+    if task_result.state == "PENDING":
+        return {"status": "PENDING", "progress": 0}
+    elif task_result.state == "PROGRESS":
+        return {
+            "status": "IN_PROGRESS",
+            "progress": task_result.info.get("progress", 0),
+        }
+    elif task_result.state == "SUCCESS":
+        return {
+            "status": "SUCCESS",
+            "progress": 100,
+            "message": task_result.result,
+        }
+    elif task_result.state == "FAILURE":
+        return {
+            "status": "FAILED",
+            "progress": 100,
+            "error": str(task_result.info),  # Include error message
+        }
+    return {"status": task_result.state, "progress": 0}
+
+
 class ReportStatusView(APIView):
     def get(self, request, task_id):
         try:
-            # Get the task result using the provided task_id
-            task_result = AsyncResult(task_id)
-
-            # Determine the task status
-            if task_result.state == "PENDING":
-                response = {"status": "PENDING", "progress": 0}
-            elif task_result.state == "PROGRESS":
-                response = {
-                    "status": "IN_PROGRESS",
-                    "progress": task_result.info.get("progress", 0),
-                }
-            elif task_result.state == "SUCCESS":
-                response = {
-                    "status": "SUCCESS",
-                    "progress": 100,
-                    "message": task_result.result,
-                }
-            elif task_result.state == "FAILURE":
-                response = {
-                    "status": "FAILED",
-                    "progress": 100,
-                    "error": str(task_result.info),  # Include error message
-                }
-            else:
-                response = {"status": task_result.state, "progress": 0}
-
-            return Response(response)
+            return Response(task_status(task_id))
 
         except Exception as e:
             return Response(